@@ -0,0 +1,282 @@
+"""Benchmarks for the rules.txt generator on synthetic Tiled project trees.
+
+Generates project trees of different sizes on local disk, then times the
+discovery (scan), merge and write stages separately and records throughput
+and peak memory. The whole read, scan, merge and write pipeline is also run
+end to end, both streamed as generate() does it and with the earlier
+list-based implementation, to compare their peak memory. Results are
+printed and can be saved as JSON and compared with an earlier run:
+
+    python benchmarks/bench_rules.py --sizes 1000 10000 100000 --output new.json --compare old.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rules_core  # noqa: E402
+
+RESULTS_VERSION = 1
+
+
+def generate_tree(base_dir, files, depth=4, fanout=8, files_per_dir=50, tmx_ratio=0.5,
+                  existing_ratio=0.5, seed=0):
+    """Create a synthetic Tiled project in base_dir and return its rule folder.
+
+    files empty files are spread over a tree of folders below base_dir/rules
+    that is at most depth levels deep with fanout subfolders per folder;
+    tmx_ratio of them are .tmx files and the rest tileset images. A rules.txt
+    with existing_ratio times as many lines as there are .tmx files is
+    written too, half of them listing files of the tree and half stale ones.
+    """
+    rng = random.Random(seed)
+    rule_dir = os.path.join(base_dir, "rules")
+
+    # Breadth-first list of folders, so small trees stay shallow and balanced
+    wanted_dirs = max(1, -(-files // files_per_dir))
+    folders = [""]
+    level = [""]
+    for _ in range(depth):
+        if len(folders) >= wanted_dirs:
+            break
+        next_level = []
+        for parent in level:
+            for child in range(fanout):
+                next_level.append(f"{parent}/d{child}" if parent else f"d{child}")
+        level = next_level
+        folders.extend(level)
+    folders = folders[:wanted_dirs]
+    for folder in folders:
+        os.makedirs(os.path.join(rule_dir, folder), exist_ok=True)
+
+    tmx_files = []
+    for number in range(files):
+        folder = folders[number % len(folders)]
+        is_tmx = rng.random() < tmx_ratio
+        name = f"rule_{number}.tmx" if is_tmx else f"tiles_{number}.png"
+        with open(os.path.join(rule_dir, folder, name), "wb"):
+            pass
+        if is_tmx:
+            tmx_files.append(f"rules/{folder}/{name}" if folder else f"rules/{name}")
+
+    existing_count = int(len(tmx_files) * existing_ratio)
+    kept = rng.sample(tmx_files, min(len(tmx_files), existing_count // 2))
+    stale = [f"old/rule_{number}.tmx" for number in range(existing_count - len(kept))]
+    with open(os.path.join(base_dir, "rules.txt"), "w", encoding="utf-8") as rules_file:
+        for rule in kept + stale:
+            rules_file.write(f"{rule}\n")
+    return rule_dir
+
+
+def _measure(fn, memory):
+    """Run fn() and return (result, wall seconds, cpu seconds, peak traced bytes or None)."""
+    if memory:
+        tracemalloc.start()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = fn()
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, wall, cpu, peak
+
+
+def _legacy_merge(existing_rules, tmx_files):
+    """The list-based merge used before MergeStream, kept as a baseline.
+
+    Holds the merged list plus full normalised keys in three sets.
+    """
+    seen = set()
+    rules = []
+    for rule in existing_rules:
+        key = rules_core.rule_key(rule)
+        if key not in seen:
+            seen.add(key)
+            rules.append(rule)
+    existing_keys = set(seen)
+    scanned_keys = set()
+    for tmx_file in tmx_files:
+        key = rules_core.rule_key(tmx_file)
+        if key in scanned_keys:
+            continue
+        scanned_keys.add(key)
+        if key not in seen:
+            seen.add(key)
+            rules.append(tmx_file)
+    return rules, len(existing_keys - scanned_keys)
+
+
+def _legacy_pipeline(rules_path, root_dir, rule_dir, out_path, workers):
+    """Read, scan, merge and write with full in-memory lists; returns the rule count."""
+    existing = rules_core.read(rules_path)
+    tmx_files = list(rules_core.scan(root_dir, [rule_dir], workers))
+    rules, _ = _legacy_merge(existing.rules, tmx_files)
+    rules_core.write(out_path, rules, existing.data)
+    return len(rules)
+
+
+def _stream_pipeline(rules_path, root_dir, rule_dir, out_path, workers):
+    """Read, scan, merge and write as one stream, like generate(); returns the rule count."""
+    merged = rules_core.MergeStream(rules_core.iter_rules(rules_path),
+                                    rules_core.scan(root_dir, [rule_dir], workers))
+    rules_core.write(out_path, merged)
+    return merged.count
+
+
+def run_stages(root_dir, rule_dir, workers=None, memory=False):
+    """Time the scan, merge and write stages and both pipelines once; returns a dict per stage."""
+    rules_path = os.path.join(root_dir, "rules.txt")
+    existing = rules_core.read(rules_path)
+
+    tmx_files, *scan_stats = _measure(
+        lambda: list(rules_core.scan(root_dir, [rule_dir], workers)), memory)
+    merged, *merge_stats = _measure(
+        lambda: rules_core.merge(existing.rules, tmx_files), memory)
+    # Write next to rules.txt so the temporary file lands on the same disk
+    out_path = os.path.join(root_dir, "rules_bench.txt")
+    _, *write_stats = _measure(
+        lambda: rules_core.write(out_path, merged.rules), memory)
+    os.remove(out_path)
+    # Free the stage results so they don't count towards the pipeline peaks
+    items = {"scan": len(tmx_files), "merge": len(existing.rules) + len(tmx_files), "write": len(merged.rules)}
+    del existing, tmx_files, merged
+
+    count, *stream_stats = _measure(
+        lambda: _stream_pipeline(rules_path, root_dir, rule_dir, out_path, workers), memory)
+    os.remove(out_path)
+    items["stream"] = count
+    count, *legacy_stats = _measure(
+        lambda: _legacy_pipeline(rules_path, root_dir, rule_dir, out_path, workers), memory)
+    os.remove(out_path)
+    items["legacy"] = count
+
+    stages = {}
+    for name, (wall, cpu, peak) in (
+            ("scan", scan_stats),
+            ("merge", merge_stats),
+            ("write", write_stats),
+            ("stream", stream_stats),
+            ("legacy", legacy_stats)):
+        stages[name] = {
+            "items": items[name],
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "items_per_s": items[name] / wall if wall else None,
+            "peak_bytes": peak,
+        }
+    return stages
+
+
+def benchmark(size, args):
+    """Build a tree with size files, benchmark it and return its result record."""
+    base_dir = tempfile.mkdtemp(prefix=f"rules_bench_{size}_", dir=args.tmpdir)
+    try:
+        started = time.perf_counter()
+        rule_dir = generate_tree(base_dir, size, args.depth, args.fanout, args.files_per_dir,
+                                 args.tmx_ratio, args.existing, args.seed)
+        setup_s = time.perf_counter() - started
+
+        # Best of several runs for timing; memory is traced separately since
+        # tracemalloc slows everything down
+        runs = [run_stages(base_dir, rule_dir, args.workers) for _ in range(args.repeat)]
+        stages = {name: min((run[name] for run in runs), key=lambda stage: stage["wall_s"])
+                  for name in runs[0]}
+        if not args.no_memory:
+            traced = run_stages(base_dir, rule_dir, args.workers, memory=True)
+            for name, stage in traced.items():
+                stages[name]["peak_bytes"] = stage["peak_bytes"]
+        return {"files": size, "setup_s": setup_s, "stages": stages}
+    finally:
+        if args.keep:
+            print(f"Kept tree: {base_dir}")
+        else:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def _format_bytes(value):
+    if value is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB"):
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GiB"
+
+
+def print_result(result, baseline=None):
+    print(f"{result['files']:>9} files (tree built in {result['setup_s']:.1f}s)")
+    for name, stage in result["stages"].items():
+        line = (f"  {name:<6} {stage['items']:>9} items  {stage['wall_s'] * 1000:>9.1f} ms wall "
+                f"{stage['cpu_s'] * 1000:>9.1f} ms cpu  {stage['items_per_s'] or 0:>12,.0f}/s  "
+                f"peak {_format_bytes(stage['peak_bytes'])}")
+        if baseline and name in baseline["stages"] and baseline["stages"][name]["wall_s"]:
+            ratio = stage["wall_s"] / baseline["stages"][name]["wall_s"]
+            line += f"  ({ratio:.2f}x baseline time)"
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark rules.txt generation on synthetic project trees.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="total files per generated tree (default: %(default)s; up to 1000000 works)")
+    parser.add_argument("--depth", type=int, default=4, help="maximum folder depth (default: %(default)s)")
+    parser.add_argument("--fanout", type=int, default=8, help="subfolders per folder (default: %(default)s)")
+    parser.add_argument("--files-per-dir", type=int, default=50, help="files per folder (default: %(default)s)")
+    parser.add_argument("--tmx-ratio", type=float, default=0.5,
+                        help="share of files that are .tmx rule maps (default: %(default)s)")
+    parser.add_argument("--existing", type=float, default=0.5,
+                        help="size of the existing rules.txt relative to the .tmx count (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="scan threads (default: rules_core's choice)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per size, best is kept (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the tree layout")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory run")
+    parser.add_argument("--tmpdir", default=None, help="where to build the trees (default: system temp folder)")
+    parser.add_argument("--keep", action="store_true", help="don't delete the generated trees")
+    parser.add_argument("--output", metavar="FILE", help="save the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare with results saved by an earlier run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baselines = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            baselines = {result["files"]: result for result in json.load(baseline_file)["results"]}
+
+    results = []
+    for size in args.sizes:
+        result = benchmark(size, args)
+        print_result(result, baselines.get(size))
+        results.append(result)
+
+    if args.output:
+        report = {
+            "version": RESULTS_VERSION,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {key: value for key, value in vars(args).items()
+                         if key not in ("output", "compare", "keep")},
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"Results saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
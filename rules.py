@@ -1,8 +1,14 @@
 import os
 import time
 import sys
+import argparse
+import itertools
+import json
 from datetime import datetime
 
+import rules_core
+from rules_core import ScanCache
+
 # ANSI color codes for terminal styling
 class Colors:
     HEADER = '\033[95m'
@@ -15,6 +21,12 @@ class Colors:
     UNDERLINE = '\033[4m'
     END = '\033[0m'
 
+    @classmethod
+    def disable(cls):
+        """Blank every code, for output that doesn't go to a terminal."""
+        for name in ("HEADER", "BLUE", "CYAN", "GREEN", "YELLOW", "RED", "BOLD", "UNDERLINE", "END"):
+            setattr(cls, name, '')
+
 def print_logo():
     """Display a center-aligned ASCII logo."""
     # Get terminal width for centering (default to 80 if unable to determine)
@@ -114,7 +126,11 @@ def get_valid_directory(prompt, base_dir=None):
                 return None
 
 def collect_directories():
-    """Get the main folder and rule folders from the user."""
+    """Get the main folder and rule folders from the user.
+
+    Also returns the existing rules.txt as a RulesSnapshot (or None), so it
+    doesn't have to be read again when writing.
+    """
     typing_effect(f"{Colors.CYAN}Welcome to the Tiled rules.txt generator!{Colors.END}")
     typing_effect(f"{Colors.CYAN}This tool creates a rules.txt file for Tiled's Automapping feature.{Colors.END}\n")
     
@@ -125,16 +141,16 @@ def collect_directories():
     
     if not root_dir:
         print(f"\n{Colors.RED}No valid main folder provided. Program cannot continue.{Colors.END}")
-        return None, []
+        return None, [], None
     
     # Check for existing rules.txt file early
     rules_file_path = os.path.join(root_dir, "rules.txt")
+    existing = None
     if os.path.isfile(rules_file_path):
         print(f"\n{Colors.YELLOW}⚠️  Notice: A rules.txt file already exists in {root_dir}{Colors.END}")
         try:
-            with open(rules_file_path, "r", encoding="utf-8") as existing_file:
-                existing_rules = [line.strip() for line in existing_file if line.strip()]
-            print(f"{Colors.CYAN}The existing file contains {len(existing_rules)} rule entries.{Colors.END}")
+            existing = rules_core.read(rules_file_path)
+            print(f"{Colors.CYAN}The existing file contains {len(existing.rules)} rule entries.{Colors.END}")
             print(f"{Colors.CYAN}You'll have options to add to or replace this file after scanning for rule files.{Colors.END}\n")
         except Exception as e:
             print(f"{Colors.RED}Unable to read the existing rules.txt file: {str(e)}{Colors.END}")
@@ -216,170 +232,713 @@ def collect_directories():
             else:
                 break
 
-    return root_dir, directories
+    return root_dir, directories, existing
 
 
-def find_tmx_files(root_dir, directories):
-    """Find all .tmx files in the specified folders."""
-    print(f"\n{Colors.BLUE}Scanning directories for .tmx files...{Colors.END}")
-    
-    tmx_files = []
+def scan_progress(directories):
+    """Return a rules_core progress callback that prints each folder as it is scanned."""
     total_dirs = len(directories)
+    current = -1
     
-    for i, directory in enumerate(directories):
-        # Display directory being scanned
-        print(f"{Colors.CYAN}Scanning: {directory}{Colors.END}")
+    def show_progress(event):
+        nonlocal current
+        if event.index != current:
+            # Show progress for the folders finished so far
+            if current >= 0:
+                progress_bar(total_dirs, event.index)
+            current = event.index
+            # Display directory being scanned
+            print(f"{Colors.CYAN}Scanning: {directories[current]}{Colors.END}")
         
-        for root, _, files in os.walk(directory):
-            tmx_in_dir = [f for f in files if f.endswith(".tmx")]
-            if tmx_in_dir:
-                print(f"  {Colors.GREEN}Found {len(tmx_in_dir)} .tmx files in {os.path.relpath(root, directory)}{Colors.END}")
-                
-                for file in tmx_in_dir:
-                    full_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(full_path, start=root_dir)
-                    tmx_files.append(relative_path.replace("\\", "/"))
+        if event.found:
+            print(f"  {Colors.GREEN}Found {event.found} .tmx files in {os.path.relpath(event.path, directories[current])}{Colors.END}")
+    return show_progress
+
+
+def find_tmx_files(root_dir, directories, quiet=False, workers=None, cache=None, ignore=None,
+                   profiler=rules_core.NULL_PROFILER):
+    """Find all .tmx files in the specified folders, skipping those excluded by ignore."""
+    if not quiet:
+        print(f"\n{Colors.BLUE}Scanning directories for .tmx files...{Colors.END}")
+    total_dirs = len(directories)
+    
+    with profiler.stage("scan"):
+        tmx_files = list(rules_core.scan(root_dir, directories, workers, cache,
+                                         progress=None if quiet else scan_progress(directories), ignore=ignore,
+                                         profiler=profiler))
         
-        # Show progress
-        progress_bar(total_dirs, i + 1)
+    if cache is not None:
+        with profiler.stage("cache"):
+            cache.save()
         
-    print(f"\n{Colors.GREEN}Scan complete! Found {len(tmx_files)} total .tmx files{Colors.END}")
+    if not quiet:
+        progress_bar(total_dirs, total_dirs)
+        print(f"\n{Colors.GREEN}Scan complete! Found {len(tmx_files)} total .tmx files{Colors.END}")
+        if cache is not None and cache.hits:
+            print(f"{Colors.CYAN}{cache.hits} unchanged folders were reused from the scan cache.{Colors.END}")
+    return tmx_files
+
+
+def check_rule_maps(root_dir, tmx_files, validation, quiet=False, use_cache=True,
+                    profiler=rules_core.NULL_PROFILER):
+    """Validate the rule maps, report the invalid ones and return the files to keep.
+
+    With validation "exclude" invalid maps are left out; with "report" all
+    files are kept.
+    """
+    if not quiet:
+        print(f"\n{Colors.BLUE}Validating {len(tmx_files)} rule maps...{Colors.END}")
+    with profiler.stage("validate"):
+        cache = rules_core.ValidationCache.load(root_dir) if use_cache else None
+        results = rules_core.validate(root_dir, tmx_files, cache=cache)
+        if cache is not None:
+            cache.save()
+    
+    invalid = [result for result in results if not result.valid]
+    for result in invalid:
+        print(f"{Colors.YELLOW}⚠️  {result.path}: {result.reason}{Colors.END}")
+    if not invalid:
+        if not quiet:
+            print(f"{Colors.GREEN}All rule maps are valid.{Colors.END}")
+        return tmx_files
+    if validation == "exclude":
+        print(f"{Colors.YELLOW}{len(invalid)} invalid rule maps will be left out of rules.txt.{Colors.END}")
+        return [result.path for result in results if result.valid]
+    print(f"{Colors.YELLOW}{len(invalid)} rule maps are not valid rule maps.{Colors.END}")
     return tmx_files
 
 
-def write_rules_txt(tmx_files, root_dir):
-    """Create the rules.txt file with all the .tmx files."""
+def write_rules_txt(tmx_files, root_dir, mode=None, quiet=False, nfc=False, existing=None,
+                    profiler=rules_core.NULL_PROFILER):
+    """Create the rules.txt file with all the .tmx files.
+
+    With mode=None the user is asked what to do with an existing file.
+    Otherwise mode is one of "add", "overwrite" or "backup" (overwrite after
+    backing up) and the file is written without prompts or animations.
+    Duplicates are compared with rules_core.rule_key(), see rules_core.merge()
+    for nfc; in batch mode the merged rules are streamed into the file.
+    existing is a RulesSnapshot from an earlier rules_core.read() call, which
+    is reused if rules.txt hasn't changed since. Returns False if the
+    operation was cancelled or failed.
+    """
+    interactive = mode is None
     # Explicitly set the rules file path to be in the root_dir (Tiled project folder)
     rules_file_path = os.path.join(root_dir, "rules.txt")
     existing_rules = []
+    existing_data = None
+    backup_path = None
     
     # Check if rules.txt already exists in the main folder
     if os.path.isfile(rules_file_path):
-        print(f"\n{Colors.YELLOW}⚠️  A rules.txt file already exists in {root_dir}{Colors.END}")
+        if not quiet:
+            print(f"\n{Colors.YELLOW}⚠️  A rules.txt file already exists in {root_dir}{Colors.END}")
         
         # Read existing rules
         try:
-            with open(rules_file_path, "r", encoding="utf-8") as existing_file:
-                existing_rules = [line.strip() for line in existing_file if line.strip()]
+            with profiler.stage("read"):
+                existing = rules_core.read(rules_file_path, existing)
+            if existing is not None:
+                existing_rules = existing.rules
+                existing_data = existing.data
                 
-            print(f"{Colors.CYAN}The existing file contains {len(existing_rules)} rule entries.{Colors.END}")
+            if not quiet:
+                print(f"{Colors.CYAN}The existing file contains {len(existing_rules)} rule entries.{Colors.END}")
             
-            # Ask user what to do
-            choice = input(f"{Colors.YELLOW}Would you like to: {Colors.END}\n"
-                          f"{Colors.GREEN}1){Colors.END} Add new rules to the existing file\n"
-                          f"{Colors.GREEN}2){Colors.END} Create a new rules.txt file (overwrite)\n"
-                          f"{Colors.GREEN}3){Colors.END} Cancel operation\n"
-                          f"{Colors.GREEN}>{Colors.END} ").strip()
-            
-            check_for_exit(choice)
+            if interactive:
+                # Ask user what to do
+                choice = input(f"{Colors.YELLOW}Would you like to: {Colors.END}\n"
+                              f"{Colors.GREEN}1){Colors.END} Add new rules to the existing file\n"
+                              f"{Colors.GREEN}2){Colors.END} Create a new rules.txt file (overwrite)\n"
+                              f"{Colors.GREEN}3){Colors.END} Cancel operation\n"
+                              f"{Colors.GREEN}>{Colors.END} ").strip()
+                
+                check_for_exit(choice)
+            else:
+                choice = "1" if mode == "add" else "2"
             
             if choice == "3":
                 print(f"\n{Colors.YELLOW}Operation cancelled. No changes were made to the rules.txt file.{Colors.END}")
-                return
+                return False
             
             # Option to backup the existing file
             if choice == "2":
-                backup = input(f"{Colors.YELLOW}Would you like to backup the existing rules.txt file? (Y/n): {Colors.END}").strip().lower()
-                check_for_exit(backup)
+                if interactive:
+                    backup = input(f"{Colors.YELLOW}Would you like to backup the existing rules.txt file? (Y/n): {Colors.END}").strip().lower()
+                    check_for_exit(backup)
+                else:
+                    backup = "y" if mode == "backup" else "n"
                 
                 if backup != "n":
-                    backup_filename = f"rules_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-                    backup_path = os.path.join(root_dir, backup_filename)
-                    try:
-                        with open(rules_file_path, "r", encoding="utf-8") as src, open(backup_path, "w", encoding="utf-8") as dst:
-                            dst.write(src.read())
-                        print(f"{Colors.GREEN}✓ Backup created: {backup_filename}{Colors.END}")
-                    except Exception as e:
-                        print(f"{Colors.RED}Error creating backup: {str(e)}{Colors.END}")
-                        return
+                    # The backup is made just before the new file replaces the old one
+                    backup_path = os.path.join(root_dir, rules_core.backup_name())
         
         except Exception as e:
             print(f"{Colors.RED}Error reading existing rules.txt: {str(e)}{Colors.END}")
-            choice = input(f"{Colors.YELLOW}Would you like to create a new rules.txt file? (Y/n): {Colors.END}").strip().lower()
-            check_for_exit(choice)
-            if choice == "n":
-                return
+            if interactive:
+                choice = input(f"{Colors.YELLOW}Would you like to create a new rules.txt file? (Y/n): {Colors.END}").strip().lower()
+                check_for_exit(choice)
+                if choice == "n":
+                    return False
+            elif mode == "add":
+                # Never silently drop rules that could not be read
+                return False
             choice = "2"  # Default to overwrite if couldn't read the existing file
     else:
         choice = "2"  # No existing file, so create a new one
     
-    print(f"\n{Colors.CYAN}{'Updating' if choice == '1' else 'Creating'} rules.txt file...{Colors.END}")
-    time.sleep(0.5)  # Slight delay for effect
+    if not quiet:
+        print(f"\n{Colors.CYAN}{'Updating' if choice == '1' else 'Creating'} rules.txt file...{Colors.END}")
+    if interactive:
+        time.sleep(0.5)  # Slight delay for effect
     
-    # Combine existing rules with new ones if adding to existing file
-    if choice == "1":
-        # Remove duplicates (case-insensitive comparison)
-        unique_tmx_files = []
-        existing_lower = [rule.lower() for rule in existing_rules]
-        
-        for tmx_file in tmx_files:
-            if tmx_file.lower() not in existing_lower:
-                unique_tmx_files.append(tmx_file)
-        
-        print(f"{Colors.BLUE}Found {len(unique_tmx_files)} new rules to add to the existing {len(existing_rules)} rules.{Colors.END}")
-        all_rules = existing_rules + unique_tmx_files
-        tmx_files = unique_tmx_files  # For progress bar, only show new files
-    else:  # choice == "2"
-        all_rules = tmx_files
+    # Combine existing rules with new ones if adding to existing file. The
+    # merge streams into the writer, so its counts are only known after
+    # writing unless the interactive mode needs them for the progress bar
+    merged = rules_core.MergeStream(existing_rules if choice == "1" else [], tmx_files, nfc)
+    all_rules = merged
+    if interactive or profiler:
+        with profiler.stage("merge"):
+            all_rules = list(merged)
     
-    # Show writing progress
-    total = len(tmx_files)
-    for i in range(total):
-        progress_bar(total, i + 1)
-        time.sleep(0.01)  # Quick but visible progress
+    def show_counts():
+        if quiet:
+            return
+        if choice == "1":
+            print(f"{Colors.BLUE}Found {merged.added} new rules to add to the existing {len(existing_rules)} rules.{Colors.END}")
+            if merged.stale:
+                print(f"{Colors.YELLOW}{merged.stale} existing rules were not found in the scanned folders and were kept.{Colors.END}")
+        if merged.duplicates:
+            print(f"{Colors.BLUE}Skipped {merged.duplicates} duplicate entries.{Colors.END}")
+    
+    if interactive:
+        show_counts()
+        # Show writing progress, only for the new files
+        total = merged.added
+        for i in range(total):
+            progress_bar(total, i + 1)
+            time.sleep(0.01)  # Quick but visible progress
     
     # Write the rules file
-    with open(rules_file_path, "w", encoding="utf-8") as rules_file:
-        for rule in all_rules:
-            rules_file.write(f"{rule}\n")
+    try:
+        with profiler.stage("write"):
+            written = rules_core.write(rules_file_path, all_rules, existing_data, backup_path)
+    except OSError as e:
+        print(f"{Colors.RED}Error writing rules.txt: {str(e)}{Colors.END}")
+        return False
+    if not interactive:
+        show_counts()
     
-    if choice == "1":
-        print(f"\n\n{Colors.GREEN}✅ Done! 'rules.txt' has been updated with {len(tmx_files)} new rule files.{Colors.END}")
-        print(f"{Colors.GREEN}The file now contains {len(all_rules)} total rules.{Colors.END}")
-    else:  # choice == "2"
-        print(f"\n\n{Colors.GREEN}✅ Done! A new 'rules.txt' has been created with {len(all_rules)} rule files.{Colors.END}")
+    if not quiet:
+        if backup_path and written:
+            print(f"\n{Colors.GREEN}✓ Backup created: {os.path.basename(backup_path)}{Colors.END}")
+        if not written:
+            print(f"\n\n{Colors.GREEN}✅ Done! 'rules.txt' is already up to date with {merged.count} rule files.{Colors.END}")
+        elif choice == "1":
+            print(f"\n\n{Colors.GREEN}✅ Done! 'rules.txt' has been updated with {merged.added} new rule files.{Colors.END}")
+            print(f"{Colors.GREEN}The file now contains {merged.count} total rules.{Colors.END}")
+        else:  # choice == "2"
+            print(f"\n\n{Colors.GREEN}✅ Done! A new 'rules.txt' has been created with {merged.count} rule files.{Colors.END}")
+    return True
+
+
+def stream_rules_txt(root_dir, directories, mode, quiet=False, nfc=False, workers=None, cache=None, ignore=None):
+    """Scan the folders and write rules.txt in one pass, without prompts.
+
+    The existing rules and the scanned files flow through a
+    rules_core.MergeStream straight into the file, so neither is kept in a
+    list; the counts are printed once it is written. Used by batch mode when
+    there is nothing to confirm or validate. Returns False if nothing was
+    found or written.
+    """
+    if not quiet:
+        print(f"\n{Colors.BLUE}Scanning directories for .tmx files...{Colors.END}")
+    rules_file_path = os.path.join(root_dir, "rules.txt")
+    found = 0
+
+    def scanned():
+        nonlocal found
+        for tmx_file in rules_core.scan(root_dir, directories, workers, cache,
+                                        progress=None if quiet else scan_progress(directories), ignore=ignore):
+            found += 1
+            yield tmx_file
+
+    tmx_files = scanned()
+    # Look at the first file before touching rules.txt, so an empty scan never replaces it
+    first = next(tmx_files, None)
+    if first is None:
+        print(f"{Colors.RED}❌ No .tmx files found in the folders you specified.{Colors.END}", file=sys.stderr)
+        return False
+
+    existing = os.path.isfile(rules_file_path)
+    backup_path = None
+    if mode == "backup" and existing:
+        backup_path = os.path.join(root_dir, rules_core.backup_name())
+    merged = rules_core.MergeStream(rules_core.iter_rules(rules_file_path) if mode == "add" else (),
+                                    itertools.chain([first], tmx_files), nfc)
+    try:
+        written = rules_core.write(rules_file_path, merged, None, backup_path)
+    except (OSError, UnicodeDecodeError) as e:
+        # Nothing was replaced, so rules that could not be read are never dropped
+        print(f"{Colors.RED}Error writing rules.txt: {str(e)}{Colors.END}", file=sys.stderr)
+        return False
+    if cache is not None:
+        cache.save()
+
+    if not quiet:
+        progress_bar(len(directories), len(directories))
+        print(f"\n{Colors.GREEN}Scan complete! Found {found} total .tmx files{Colors.END}")
+        if cache is not None and cache.hits:
+            print(f"{Colors.CYAN}{cache.hits} unchanged folders were reused from the scan cache.{Colors.END}")
+        if mode == "add" and existing:
+            print(f"{Colors.BLUE}Found {merged.added} new rules to add to the existing "
+                  f"{merged.count - merged.added} rules.{Colors.END}")
+            if merged.stale:
+                print(f"{Colors.YELLOW}{merged.stale} existing rules were not found in the scanned folders and were kept.{Colors.END}")
+        if merged.duplicates:
+            print(f"{Colors.BLUE}Skipped {merged.duplicates} duplicate entries.{Colors.END}")
+        if backup_path and written:
+            print(f"\n{Colors.GREEN}✓ Backup created: {os.path.basename(backup_path)}{Colors.END}")
+        if not written:
+            print(f"\n\n{Colors.GREEN}✅ Done! 'rules.txt' is already up to date with {merged.count} rule files.{Colors.END}")
+        elif mode == "add" and existing:
+            print(f"\n\n{Colors.GREEN}✅ Done! 'rules.txt' has been updated with {merged.added} new rule files.{Colors.END}")
+            print(f"{Colors.GREEN}The file now contains {merged.count} total rules.{Colors.END}")
+        else:
+            print(f"\n\n{Colors.GREEN}✅ Done! A new 'rules.txt' has been created with {merged.count} rule files.{Colors.END}")
+    return True
+
+
+def print_tree_conflicts(conflicts):
+    """Explain why the tree layout can't be added to a flat rules.txt."""
+    print(f"{Colors.RED}Error: rules.txt already lists {len(conflicts)} rule maps from the rule folders, "
+          f"which the tree layout includes from per-folder files instead. Run once with --mode overwrite "
+          f"or --mode backup to switch layouts.{Colors.END}", file=sys.stderr)
+
+
+def write_rules_tree(tmx_files, root_dir, directories, mode, quiet=False, nfc=False,
+                     profiler=rules_core.NULL_PROFILER):
+    """Write a rules.txt per rule folder and a main rules.txt including them.
+
+    The per-folder files always mirror their folder; mode only applies to
+    the main rules.txt, as in write_rules_txt(). Files whose content didn't
+    change are left alone. Refuses to add the includes to a main rules.txt
+    that still lists the rule maps itself. Returns False if nothing could be
+    written.
+    """
+    if not quiet:
+        print(f"\n{Colors.CYAN}Writing rules.txt files for each rule folder...{Colors.END}")
+    try:
+        with profiler.stage("write"):
+            tree = rules_core.build_tree(root_dir, directories, tmx_files)
+            conflicts = rules_core.tree_conflicts(root_dir, directories, tree, nfc) if mode == "add" else []
+            if conflicts:
+                print_tree_conflicts(conflicts)
+                return False
+            results = rules_core.write_tree(root_dir, tree, mode, nfc)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"{Colors.RED}Error writing rules.txt: {str(e)}{Colors.END}")
+        return False
+
+    if not quiet:
+        written = [result for result in results if result.written]
+        for result in written:
+            print(f"  {Colors.GREEN}Updated {os.path.relpath(result.path, root_dir)} ({result.rules} entries){Colors.END}")
+        if written:
+            print(f"\n{Colors.GREEN}✅ Done! {len(written)} of {len(results)} rules.txt files were updated.{Colors.END}")
+        else:
+            print(f"\n{Colors.GREEN}✅ Done! All {len(results)} rules.txt files are already up to date.{Colors.END}")
+    return True
+
+
+# Options that only batch runs use; the interactive mode rejects them
+BATCH_OPTIONS = ("mode", "layout", "validate", "nfc", "workers", "yes", "processes", "io_limit")
+
+
+def parse_args(argv=None):
+    """Parse command line options for non-interactive (batch) runs."""
+    parser = argparse.ArgumentParser(
+        description="Generate a rules.txt file for Tiled's Automapping feature. "
+                    "Run without options for the interactive mode.")
+    parser.add_argument("--root", help="main Tiled project folder (where rules.txt is written)")
+    parser.add_argument("--dir", dest="dirs", action="append", default=[], metavar="DIR",
+                        help="folder containing rule files, relative to --root (repeatable)")
+    parser.add_argument("--mode", choices=rules_core.MODES, default="add",
+                        help="what to do with an existing rules.txt (default: add)")
+    parser.add_argument("--layout", choices=rules_core.LAYOUTS, default="flat",
+                        help="write one rules.txt (flat) or a rules.txt per rule folder included "
+                             "from the main one (tree) (default: %(default)s)")
+    parser.add_argument("--yes", "-y", action="store_true",
+                        help="don't ask for confirmation before writing rules.txt")
+    parser.add_argument("--quiet", "-q", action="store_true",
+                        help="only print errors")
+    parser.add_argument("--workers", type=int, default=None, metavar="N",
+                        help="threads used to list folders (default: 1; raise it for network storage, "
+                             "where listing a folder is slow)")
+    parser.add_argument("--nfc", action="store_true",
+                        help="treat paths that only differ in Unicode normalisation as duplicates")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="gitignore-style pattern of folders or files to skip (repeatable); "
+                             f"patterns are also read from {rules_core.IgnoreRules.FILENAME} in the main folder")
+    parser.add_argument("--include", action="append", default=[], metavar="PATTERN",
+                        help="only keep rule files matching a gitignore-style pattern (repeatable)")
+    parser.add_argument("--validate", choices=rules_core.VALIDATE_MODES, default=None,
+                        help="check that each .tmx file has input and output layers, and "
+                             "report invalid maps or exclude them from rules.txt")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"rescan every folder instead of reusing {ScanCache.FILENAME}")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and rewrite rules.txt whenever rule files are added or removed")
+    parser.add_argument("--interval", type=float, default=1.0, metavar="SECONDS",
+                        help="how often to check for changes when inotify is unavailable (default: %(default)s)")
+    parser.add_argument("--debounce", type=float, default=0.5, metavar="SECONDS",
+                        help="quiet period to wait for after a change before rescanning (default: %(default)s)")
+    parser.add_argument("--check", action="store_true",
+                        help="only check whether rules.txt is up to date, without writing it; "
+                             "exits with 1 if it would change")
+    parser.add_argument("--diff", action="store_true",
+                        help="like --check, and also print the entries that would be added (+) or removed (-)")
+    parser.add_argument("--manifest", metavar="FILE",
+                        help="generate rules.txt for every project listed in a JSON or TOML manifest")
+    parser.add_argument("--discover", metavar="DIR",
+                        help="generate rules.txt for every Tiled project found below DIR, "
+                             "using the --dir folders of each project")
+    parser.add_argument("--processes", type=int, default=None, metavar="N",
+                        help="projects generated in parallel with --manifest/--discover "
+                             "(default: the CPU count)")
+    parser.add_argument("--io-limit", type=int, default=4, metavar="N",
+                        help="projects on the same disk scanned at once (default: %(default)s)")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="save per-stage timings, folder counts and the slowest folders to FILE")
+    parser.add_argument("--profile-format", choices=("json", "jsonl"), default="json",
+                        help="write --profile as one JSON report or as a JSON Lines event stream "
+                             "(default: %(default)s)")
+    parser.add_argument("--cprofile", metavar="FILE",
+                        help="also save cProfile statistics of the main thread to FILE")
+    return parser.parse_args(argv)
 
 
+def run_batch(args, profiler=rules_core.NULL_PROFILER):
+    """Generate rules.txt from command line options without any prompts.
+
+    Returns a process exit code.
+    """
+    if not args.root or not os.path.isdir(args.root):
+        print(f"{Colors.RED}Error: The main folder '{args.root}' doesn't exist.{Colors.END}", file=sys.stderr)
+        return 2
+    if not args.dirs:
+        print(f"{Colors.RED}Error: At least one --dir is required.{Colors.END}", file=sys.stderr)
+        return 2
+
+    root_dir = args.root
+    directories = []
+    for subdir in args.dirs:
+        full_path = os.path.join(root_dir, subdir)
+        if not os.path.isdir(full_path):
+            print(f"{Colors.RED}Error: The folder '{subdir}' doesn't exist.{Colors.END}", file=sys.stderr)
+            return 2
+        directories.append(full_path)
+
+    cache = None if args.no_cache else ScanCache.load(root_dir)
+    ignore = rules_core.IgnoreRules.load(root_dir, args.exclude, args.include)
+    if args.watch:
+        return run_watch(args, root_dir, directories, cache, ignore, profiler)
+
+    checking = args.check or args.diff
+    if args.yes and not args.validate and args.layout == "flat" and not checking and not profiler:
+        # Nothing to confirm, validate or time stage by stage, so the rules never need to be in memory at once
+        written = stream_rules_txt(root_dir, directories, args.mode, quiet=args.quiet, nfc=args.nfc,
+                                   workers=args.workers, cache=cache, ignore=ignore)
+        return 0 if written else 1
+
+    # Keep the output of --check and --diff down to their report
+    tmx_files = find_tmx_files(root_dir, directories, quiet=args.quiet or checking, workers=args.workers,
+                               cache=cache, ignore=ignore, profiler=profiler)
+    if tmx_files and args.validate:
+        tmx_files = check_rule_maps(root_dir, tmx_files, args.validate, quiet=args.quiet or checking,
+                                    use_cache=not args.no_cache, profiler=profiler)
+    if checking:
+        return run_check(args, root_dir, directories, tmx_files)
+    if not tmx_files:
+        print(f"{Colors.RED}❌ No .tmx files found in the folders you specified.{Colors.END}", file=sys.stderr)
+        return 1
+
+    if not args.yes:
+        confirm = input(f"\n{Colors.YELLOW}Ready to process {len(tmx_files)} rule files. Continue? (Y/n): {Colors.END}").strip().lower()
+        check_for_exit(confirm)
+        if confirm == 'n':
+            print(f"\n{Colors.YELLOW}Operation cancelled. No rules.txt file was created.{Colors.END}")
+            return 1
+
+    if args.layout == "tree":
+        written = write_rules_tree(tmx_files, root_dir, directories, args.mode, quiet=args.quiet, nfc=args.nfc,
+                                   profiler=profiler)
+    else:
+        written = write_rules_txt(tmx_files, root_dir, mode=args.mode, quiet=args.quiet, nfc=args.nfc,
+                                  profiler=profiler)
+    return 0 if written else 1
+
+
+def run_check(args, root_dir, directories, tmx_files):
+    """Report whether rules.txt matches the scanned rule files, without writing anything.
+
+    Every file --layout would write is streamed as a real run with --mode
+    would write it and compared with the file on disk byte for byte, so a
+    change of order or a duplicate line counts. The +/- report comes from
+    rules_core.diff(), which only sees entries added or removed. Returns 0 if
+    all of them are up to date, 1 if any would change and 2 if one couldn't
+    be read or a real run would refuse to write.
+    """
+    if not tmx_files and args.mode != "add":
+        print(f"{Colors.RED}❌ No .tmx files found in the folders you specified.{Colors.END}", file=sys.stderr)
+        return 2
+    if args.layout == "tree":
+        tree = rules_core.build_tree(root_dir, directories, tmx_files)
+        if args.mode == "add":
+            try:
+                conflicts = rules_core.tree_conflicts(root_dir, directories, tree, args.nfc)
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"{Colors.RED}Error reading rules.txt: {str(e)}{Colors.END}", file=sys.stderr)
+                return 2
+            if conflicts:
+                print_tree_conflicts(conflicts)
+                return 2
+        # Only the main file is merged with --mode; the others are always regenerated
+        files = [(path, rules, tree[folder], args.mode if folder == "" else "overwrite")
+                 for folder, path, rules in rules_core.tree_rules(root_dir, tree, args.mode, args.nfc)]
+    else:
+        path = os.path.join(root_dir, "rules.txt")
+        rules = rules_core.MergeStream(rules_core.iter_rules(path) if args.mode == "add" else (),
+                                       tmx_files, args.nfc)
+        files = [(path, rules, tmx_files, args.mode)]
+
+    outdated = 0
+    for path, rules, expected, mode in files:
+        name = os.path.relpath(path, root_dir).replace("\\", "/")
+        try:
+            if rules_core.up_to_date(path, rules):
+                continue
+            changes = rules_core.diff(rules_core.iter_rules(path), expected, mode, args.nfc)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"{Colors.RED}Error reading {name}: {str(e)}{Colors.END}", file=sys.stderr)
+            return 2
+        outdated += 1
+        if args.diff:
+            print(f"{Colors.BOLD}--- a/{name}{Colors.END}")
+            print(f"{Colors.BOLD}+++ b/{name}{Colors.END}")
+            for rule in changes.removed:
+                print(f"{Colors.RED}-{rule}{Colors.END}")
+            for rule in changes.added:
+                print(f"{Colors.GREEN}+{rule}{Colors.END}")
+        if args.quiet:
+            continue
+        if changes.added or changes.removed:
+            print(f"{Colors.YELLOW}⚠️  {name} is out of date: {len(changes.added)} to add, "
+                  f"{len(changes.removed)} to remove.{Colors.END}")
+        else:
+            print(f"{Colors.YELLOW}⚠️  {name} is out of date: only the order, duplicates or "
+                  f"line endings of its entries would change.{Colors.END}")
+
+    if not outdated and not args.quiet:
+        print(f"{Colors.GREEN}✅ rules.txt is up to date.{Colors.END}")
+    return 1 if outdated else 0
+
+
+def run_watch(args, root_dir, directories, cache, ignore=None, profiler=rules_core.NULL_PROFILER):
+    """Keep rules.txt up to date until interrupted.
+
+    rules.txt follows the scanned files in watch mode. With --mode add the
+    existing entries keep their order and only rule maps that are gone from
+    the scanned folders are dropped, while new ones are appended; otherwise
+    the file is overwritten, and with --mode backup the original is backed
+    up once.
+    """
+    rules_file_path = os.path.join(root_dir, "rules.txt")
+    modes = ["backup" if args.mode == "backup" else "overwrite"]
+
+    def on_change(tmx_files):
+        kept = []
+        if args.mode == "add" and args.layout == "flat":
+            try:
+                # Compared with the whole scan, so maps left out by --validate exclude keep their place
+                kept = list(rules_core.kept_rules(rules_core.iter_rules(rules_file_path), tmx_files,
+                                                  root_dir, directories, args.nfc))
+            except (OSError, UnicodeDecodeError) as e:
+                # Never silently drop rules that could not be read
+                print(f"{Colors.RED}Error reading existing rules.txt: {str(e)}{Colors.END}", file=sys.stderr)
+                return
+        if args.validate:
+            tmx_files = check_rule_maps(root_dir, tmx_files, args.validate, quiet=True, use_cache=not args.no_cache,
+                                        profiler=profiler)
+        mode = modes.pop() if modes else "overwrite"
+        if args.layout == "tree":
+            # The main file only includes the rule folders, so adding to it keeps extra entries
+            written = write_rules_tree(tmx_files, root_dir, directories, "add" if args.mode == "add" else mode,
+                                       quiet=True, nfc=args.nfc, profiler=profiler)
+        else:
+            written = write_rules_txt(kept + tmx_files, root_dir, mode=mode, quiet=True, nfc=args.nfc,
+                                      profiler=profiler)
+        if written and not args.quiet:
+            print(f"{Colors.YELLOW}[{datetime.now().strftime('%H:%M:%S')}]{Colors.END} "
+                  f"{Colors.GREEN}rules.txt updated with {len(tmx_files)} rule files{Colors.END}")
+
+    if not args.quiet:
+        print(f"{Colors.CYAN}Watching {len(directories)} folders for rule file changes. Press Ctrl+C to stop.{Colors.END}")
+    watch_cache = cache if cache is not None else ScanCache(root_dir)
+    try:
+        rules_core.watch(root_dir, directories, on_change, interval=args.interval, debounce=args.debounce,
+                         workers=args.workers, cache=watch_cache, ignore=ignore, profiler=profiler)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if cache is not None:
+            cache.save()
+    return 0
+
+
+def run_many(args, profiler=rules_core.NULL_PROFILER):
+    """Generate rules.txt for many projects in parallel and print a summary.
+
+    Returns a process exit code: 0 if every project succeeded, 1 otherwise.
+    """
+    try:
+        if args.manifest:
+            projects = rules_core.load_manifest(args.manifest, mode=args.mode, dirs=args.dirs)
+        elif not args.dirs:
+            print(f"{Colors.RED}Error: --discover needs at least one --dir.{Colors.END}", file=sys.stderr)
+            return 2
+        else:
+            projects = rules_core.discover_projects(args.discover, args.dirs, mode=args.mode)
+    except (OSError, ValueError) as e:
+        print(f"{Colors.RED}Error: {str(e)}{Colors.END}", file=sys.stderr)
+        return 2
+
+    if not projects:
+        print(f"{Colors.RED}❌ No projects found.{Colors.END}", file=sys.stderr)
+        return 1
+    if not args.quiet:
+        print(f"{Colors.CYAN}Generating rules.txt for {len(projects)} projects...{Colors.END}")
+
+    # Projects run in other processes, so only the batch as a whole is timed
+    with profiler.stage("generate_many"):
+        results = rules_core.generate_many(projects, processes=args.processes, io_limit=args.io_limit,
+                                           nfc=args.nfc, use_cache=not args.no_cache, validation=args.validate,
+                                           excludes=args.exclude, includes=args.include, layout=args.layout)
+    failed = 0
+    for project in results:
+        if project.error:
+            failed += 1
+            print(f"{Colors.RED}✗ {project.root}: {project.error}{Colors.END}", file=sys.stderr)
+        elif not args.quiet:
+            result = project.result
+            status = "updated" if result.written else "unchanged"
+            print(f"{Colors.GREEN}✓{Colors.END} {project.root}: {result.rules} rules "
+                  f"({result.added} new, {status})")
+        if project.result and project.result.invalid:
+            for invalid in project.result.invalid:
+                print(f"  {Colors.YELLOW}⚠️  {invalid.path}: {invalid.reason}{Colors.END}")
+
+    if not args.quiet:
+        print(f"\n{Colors.GREEN if not failed else Colors.YELLOW}{len(results) - failed} of {len(results)} projects succeeded.{Colors.END}")
+    return 1 if failed else 0
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args()
+    if not sys.stdout.isatty():
+        # Keep escape codes out of logs, pipes and --diff output
+        Colors.disable()
+
+    profiler = rules_core.NULL_PROFILER
+    events_file = None
+    if args.profile:
+        if args.profile_format == "jsonl":
+            # Line buffered, so events of long runs such as --watch show up as they happen
+            events_file = open(args.profile, "w", encoding="utf-8", buffering=1)
+        profiler = rules_core.Profiler(events=events_file)
+    cprofile = None
+    if args.cprofile:
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    try:
+        return run(args, profiler)
+    finally:
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(args.cprofile)
+        if events_file is not None:
+            profiler.finish()
+            events_file.close()
+        elif args.profile:
+            with open(args.profile, "w", encoding="utf-8") as report_file:
+                json.dump(profiler.report(), report_file, indent=2)
+
 
+def run(args, profiler=rules_core.NULL_PROFILER):
+    """Run the mode selected by the command line options; returns an exit code."""
+    if (args.check or args.diff) and (args.manifest or args.discover or args.watch):
+        print(f"{Colors.RED}Error: --check and --diff only work with --root and --dir.{Colors.END}", file=sys.stderr)
+        return 2
+    if args.manifest or args.discover:
+        return run_many(args, profiler)
+    if args.root or args.dirs or args.watch or args.check or args.diff:
+        return run_batch(args, profiler)
+    defaults = vars(parse_args([]))
+    ignored = [f"--{name.replace('_', '-')}" for name in BATCH_OPTIONS if getattr(args, name) != defaults[name]]
+    if ignored:
+        # The interactive mode asks for these itself, so don't let them pass unnoticed
+        print(f"{Colors.RED}Error: {', '.join(ignored)} only work with --root and --dir "
+              f"(or --manifest/--discover).{Colors.END}", file=sys.stderr)
+        return 2
 
-def main():
     # Clear screen for a fresh start
     os.system('cls' if os.name == 'nt' else 'clear')
     
     print_logo()
     
-    root_dir, directories = collect_directories()
+    root_dir, directories, existing = collect_directories()
 
     if not root_dir or not directories:
         print(f"\n{Colors.RED}❌ No valid folders provided. Program ended.{Colors.END}")
-        return
+        return 1
 
     print(f"\n{Colors.BOLD}{Colors.YELLOW}Step 3/3{Colors.END} - Searching for rule files...")
-    tmx_files = find_tmx_files(root_dir, directories)
+    cache = None if args.no_cache else ScanCache.load(root_dir)
+    ignore = rules_core.IgnoreRules.load(root_dir, args.exclude, args.include)
+    tmx_files = find_tmx_files(root_dir, directories, cache=cache, ignore=ignore, profiler=profiler)
 
     if not tmx_files:
         print(f"\n{Colors.RED}❌ No .tmx files found in the folders you specified.{Colors.END}")
+        return 1
     else:
         # Confirm before creating rules.txt
         confirm = input(f"\n{Colors.YELLOW}Ready to process {len(tmx_files)} rule files. Continue? (Y/n): {Colors.END}").strip().lower()
         check_for_exit(confirm)
         
         if confirm != 'n':
-            write_rules_txt(tmx_files, root_dir)
+            write_rules_txt(tmx_files, root_dir, existing=existing, profiler=profiler)
             
             # Final success message
             print(f"{Colors.BOLD}{Colors.GREEN}You can now use these rules in Tiled's Automapping feature.{Colors.END}")
             print(f"\n{Colors.CYAN}Thanks for using Tiled Rules.txt Generator!{Colors.END}")
         else:
             print(f"\n{Colors.YELLOW}Operation cancelled. No rules.txt file was created.{Colors.END}")
+    return 0
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    exit_code = 1
     try:
-        main()
+        exit_code = main(args)
     except KeyboardInterrupt:
         print(f"\n\n{Colors.YELLOW}Process interrupted by user. Exiting...{Colors.END}")
+        exit_code = 130
     except Exception as e:
         print(f"\n{Colors.RED}An error occurred: {str(e)}{Colors.END}")
     finally:
-        print(f"\n{Colors.CYAN}© {datetime.now().year} Tiled Rules Generator{Colors.END}")
\ No newline at end of file
+        # --check and --diff output is read by hooks, so it ends with the report
+        if not args.quiet and not (args.check or args.diff):
+            print(f"\n{Colors.CYAN}© {datetime.now().year} Tiled Rules Generator{Colors.END}")
+    sys.exit(exit_code)
\ No newline at end of file
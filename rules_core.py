@@ -0,0 +1,1604 @@
+"""Core of the Tiled rules.txt generator, without any terminal I/O.
+
+Build scripts can use this module directly instead of driving rules.py:
+
+    import rules_core
+    rules = rules_core.scan(root_dir, [os.path.join(root_dir, "rules")])
+    rules_core.write(os.path.join(root_dir, "rules.txt"), rules)
+
+or do a whole "add to existing rules.txt" run with generate(). Long running
+steps report progress through an optional callback that receives
+ProgressEvent tuples.
+"""
+import os
+import re
+import time
+import sys
+import contextlib
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import multiprocessing
+import select
+import shutil
+import struct
+import tempfile
+import threading
+import unicodedata
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+# Progress report passed to progress callbacks. stage is "folder" after a
+# folder was listed (path is the folder, index the selected folder it belongs
+# to out of total, found its number of .tmx files) or "write" after rules.txt
+# was written (path is the file, found the number of rules, index/total None)
+ProgressEvent = namedtuple("ProgressEvent", "stage path index total found")
+
+# Listing of one folder: its sorted .tmx file names and subfolder names, the
+# number of directory entries read, and whether it came from the scan cache
+# (in which case no entries were read)
+DirListing = namedtuple("DirListing", "tmx_names subdirs entries cached")
+
+# One scanned folder: index of the selected folder it belongs to, its path,
+# its path relative to the main folder (using "/") and its sorted .tmx names
+ScannedDir = namedtuple("ScannedDir", "index path rel tmx_names")
+
+
+def default_scan_workers():
+    """Number of threads used to list folders when none is given."""
+    # Listing a local folder takes microseconds, less than handing it to a
+    # thread, so scans are serial unless asked otherwise; more workers only
+    # pay off when listings are slow, as on network storage
+    return 1
+
+
+# Folders a worker thread lists in one task before handing the rest back,
+# so tasks are big enough to be worth a thread but results stay bounded
+SCAN_BATCH_DIRS = 256
+
+
+def _list_tmx_dir(path):
+    """List one folder, returning a DirListing.
+
+    The extension is matched case-insensitively, so .TMX files are found too.
+    """
+    tmx_names = []
+    subdirs = []
+    count = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                count += 1
+                # DirEntry caches the type from the directory listing, so no extra stat calls
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    # Like os.walk, don't follow symlinked folders
+                    if not entry.is_symlink():
+                        subdirs.append(entry.name)
+                elif entry.name[-4:].lower() == ".tmx":
+                    tmx_names.append(entry.name)
+    except OSError:
+        # Unreadable folders are skipped, as os.walk does
+        pass
+    tmx_names.sort()
+    subdirs.sort()
+    return DirListing(tmx_names, subdirs, count, False)
+
+
+class ScanCache:
+    """On-disk record of folder listings from previous scans.
+
+    Each visited folder is stored with its mtime and inode, its .tmx file
+    names and its subfolder names. A folder whose mtime and inode are
+    unchanged is not listed again; only a stat call is needed, so an unchanged
+    tree costs one stat per folder. The cache lives next to rules.txt.
+    """
+    VERSION = 2
+    FILENAME = ".rules_scan_cache.json"
+    # Folders modified this recently are not cached: a change within the same
+    # timestamp tick as the listing would otherwise go unnoticed
+    RACY_NS = 2 * 10**9
+
+    def __init__(self, root_dir):
+        self.root_dir = os.path.abspath(root_dir)
+        self.path = os.path.join(root_dir, self.FILENAME)
+        self.hits = 0
+        self.misses = 0
+        self._old = {}
+        self._new = {}
+        self._root_id = None
+
+    @classmethod
+    def load(cls, root_dir):
+        """Load the cache for root_dir, starting empty if it is missing or unusable."""
+        cache = cls(root_dir)
+        try:
+            st = os.stat(root_dir)
+            cache._root_id = [st.st_dev, st.st_ino]
+            with open(cache.path, "r", encoding="utf-8") as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError):
+            return cache
+        # Any change of format or of the main folder itself invalidates everything
+        if (isinstance(data, dict)
+                and data.get("version") == cls.VERSION
+                and data.get("root") == cache.root_dir
+                and data.get("root_id") == cache._root_id
+                and isinstance(data.get("dirs"), dict)):
+            cache._old = data["dirs"]
+        return cache
+
+    def lookup(self, path, rel):
+        """Return the cached listing of an unchanged folder like list_dir(), or None.
+
+        Costs one stat call and never lists the folder.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return self._cached(rel, st)
+
+    def list_dir(self, path, rel):
+        """Like _list_tmx_dir(), but from the cache when the folder is unchanged."""
+        try:
+            # Stat before listing, so a change during the listing is seen next time
+            st = os.stat(path)
+        except OSError:
+            return _list_tmx_dir(path)
+        listing = self._cached(rel, st)
+        if listing is not None:
+            return listing
+
+        self.misses += 1
+        listing = _list_tmx_dir(path)
+        if time.time_ns() - st.st_mtime_ns > self.RACY_NS:
+            self._new[rel] = [st.st_mtime_ns, st.st_ino, listing.tmx_names, listing.subdirs]
+        return listing
+
+    def _cached(self, rel, st):
+        """Return the cached listing of a folder if st shows it is unchanged."""
+        entry = self._old.get(rel)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_ino:
+            self.hits += 1
+            self._new[rel] = entry
+            return DirListing(entry[2], entry[3], 0, True)
+        return None
+
+    def reset(self):
+        """Start another scan that reuses the folders recorded by the last one."""
+        if self._new:
+            self._old = self._new
+            self._new = {}
+        self.hits = 0
+        self.misses = 0
+
+    def save(self):
+        """Write the folders seen in this scan back to disk, dropping the rest."""
+        data = {
+            "version": self.VERSION,
+            "root": self.root_dir,
+            "root_id": self._root_id,
+            "dirs": self._new,
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as cache_file:
+                json.dump(data, cache_file, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # The cache is only an optimisation; never fail a run because of it
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+class IgnoreRules:
+    """Gitignore-style patterns deciding which folders and files are scanned.
+
+    Exclude patterns follow .gitignore rules: they are relative to the main
+    folder, a pattern without "/" matches a name at any depth, a trailing "/"
+    only matches folders, "*", "?", "[...]" and "**" are wildcards, "!"
+    re-includes, and the last matching pattern wins. Excluded folders are
+    pruned without being listed. If include patterns are given, only files
+    matching one of them are kept. Patterns are compiled once.
+    """
+    FILENAME = ".tiledrulesignore"
+
+    def __init__(self, excludes=(), includes=()):
+        self._excludes = [self._compile(pattern) for pattern in excludes]
+        self._excludes = [rule for rule in self._excludes if rule is not None]
+        self._includes = [self._compile(pattern) for pattern in includes]
+        self._includes = [rule for rule in self._includes if rule is not None]
+
+    @classmethod
+    def load(cls, root_dir, excludes=(), includes=()):
+        """Combine the patterns in root_dir/.tiledrulesignore with the given ones.
+
+        The given exclude patterns come last, so they override the file.
+        """
+        file_patterns = []
+        try:
+            with open(os.path.join(root_dir, cls.FILENAME), "r", encoding="utf-8") as ignore_file:
+                file_patterns = ignore_file.read().splitlines()
+        except FileNotFoundError:
+            pass
+        return cls(file_patterns + list(excludes), includes)
+
+    def __bool__(self):
+        return bool(self._excludes or self._includes)
+
+    @staticmethod
+    def _compile(pattern):
+        """Turn one pattern into (regex, negate, dir_only), or None for blanks and comments."""
+        pattern = pattern.rstrip()
+        if not pattern or pattern.startswith("#"):
+            return None
+        negate = pattern.startswith("!")
+        if negate:
+            pattern = pattern[1:]
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # A slash anywhere but the end anchors the pattern to the main folder
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        if not pattern:
+            return None
+
+        regex = []
+        i = 0
+        while i < len(pattern):
+            char = pattern[i]
+            if pattern.startswith("**/", i):
+                regex.append("(?:.*/)?")
+                i += 3
+                continue
+            if pattern.startswith("**", i):
+                regex.append(".*")
+                i += 2
+                continue
+            if char == "*":
+                regex.append("[^/]*")
+            elif char == "?":
+                regex.append("[^/]")
+            elif char == "[" and pattern.find("]", i + 2) != -1:
+                # A "]" right after "[" is part of the set, as in fnmatch
+                end = pattern.find("]", i + 2)
+                body = pattern[i + 1:end].replace("\\", "\\\\")
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                regex.append(f"[{body}]")
+                i = end + 1
+                continue
+            elif char == "\\" and i + 1 < len(pattern):
+                i += 1
+                regex.append(re.escape(pattern[i]))
+            else:
+                regex.append(re.escape(char))
+            i += 1
+        prefix = "" if anchored else "(?:.*/)?"
+        return re.compile(prefix + "".join(regex) + r"\Z"), negate, dir_only
+
+    def _matches(self, rules, rel, is_dir):
+        for regex, negate, dir_only in reversed(rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel):
+                return not negate
+        return None
+
+    def excludes_dir(self, rel):
+        """Whether the folder at rel (relative to the main folder) is pruned."""
+        return bool(self._excludes) and bool(self._matches(self._excludes, rel, True))
+
+    def excludes_file(self, rel):
+        """Whether the file at rel (relative to the main folder) is left out."""
+        if self._excludes and self._matches(self._excludes, rel, False):
+            return True
+        return bool(self._includes) and not self._matches(self._includes, rel, False)
+
+
+class Profiler:
+    """Per-stage wall and CPU timers and scan counters, for --profile reports.
+
+    Time a stage with "with profiler.stage(name):". Scans given a profiler
+    count the folders and entries they list and remember the slowest
+    folders. If events is a file, every finished stage and listed folder is
+    also written to it as a line of JSON. Use NULL_PROFILER when profiling
+    is off; it does nothing and is false, so scans skip their timing code.
+    """
+    VERSION = 1
+
+    def __init__(self, slowest=10, events=None):
+        self.stages = {}
+        self.counters = {"dirs": 0, "entries": 0, "cached_dirs": 0}
+        self.slowest = slowest
+        self._slow_dirs = []  # Min-heap of (seconds, path, entries)
+        self._events = events
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            with self._lock:
+                totals = self.stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0})
+                totals["calls"] += 1
+                totals["wall_s"] += wall
+                totals["cpu_s"] += cpu
+                self._emit({"event": "stage", "name": name, "wall_s": wall, "cpu_s": cpu})
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_dir(self, path, seconds, entries, cached=False):
+        """Record one folder listing, or a folder taken from the cache if cached is true."""
+        with self._lock:
+            self.counters["dirs"] += 1
+            self.counters["entries"] += entries
+            if cached:
+                self.counters["cached_dirs"] += 1
+            item = (seconds, path, entries)
+            if len(self._slow_dirs) < self.slowest:
+                heapq.heappush(self._slow_dirs, item)
+            elif item > self._slow_dirs[0]:
+                heapq.heapreplace(self._slow_dirs, item)
+            self._emit({"event": "dir", "path": path, "seconds": seconds, "entries": entries, "cached": cached})
+
+    def timed(self, list_dir):
+        """Wrap a folder listing function so every call is recorded.
+
+        Calls returning None (a cache lookup that missed) aren't recorded.
+        """
+        def timed_list_dir(path, rel):
+            started = time.perf_counter()
+            listing = list_dir(path, rel)
+            if listing is not None:
+                self.record_dir(path, time.perf_counter() - started, listing.entries, listing.cached)
+            return listing
+        return timed_list_dir
+
+    def report(self):
+        """Return everything recorded so far as a JSON-serialisable dict."""
+        with self._lock:
+            return {
+                "version": self.VERSION,
+                "total_wall_s": time.perf_counter() - self._started,
+                "stages": {name: dict(totals) for name, totals in self.stages.items()},
+                "counters": dict(self.counters),
+                "slowest_dirs": [{"path": path, "seconds": seconds, "entries": entries}
+                                 for seconds, path, entries in sorted(self._slow_dirs, reverse=True)],
+            }
+
+    def finish(self):
+        """Write the report as a final "summary" event and return it."""
+        report = self.report()
+        with self._lock:
+            self._emit(dict(report, event="summary"))
+        return report
+
+    def _emit(self, event):
+        # Called with the lock held, so lines from different threads don't mix
+        if self._events is not None:
+            self._events.write(json.dumps(event) + "\n")
+
+
+class _NullProfiler:
+    """Profiler stand-in used when profiling is off; every call is a no-op."""
+    _stage = contextlib.nullcontext()
+
+    def __bool__(self):
+        return False
+
+    def stage(self, name):
+        return self._stage
+
+    def count(self, name, amount=1):
+        pass
+
+    def record_dir(self, path, seconds, entries, cached=False):
+        pass
+
+
+NULL_PROFILER = _NullProfiler()
+
+
+def _expand(path, rel, tmx_names, subdirs, ignore):
+    """Apply ignore to a folder listing, returning its .tmx names and the (path, rel) of its subfolders to scan.
+
+    Excluded subfolders are left out, so they are not listed at all.
+    """
+    prefix = f"{rel}/" if rel else ""
+    if ignore:
+        tmx_names = [name for name in tmx_names if not ignore.excludes_file(prefix + name)]
+    children = []
+    for name in subdirs:
+        child_rel = prefix + name
+        if ignore and ignore.excludes_dir(child_rel):
+            continue
+        children.append((os.path.join(path, name), child_rel))
+    return tmx_names, children
+
+
+def _scan_task(roots, stop, list_dir, ignore):
+    """List the subtrees at roots depth first, up to SCAN_BATCH_DIRS folders.
+
+    Returns (path, rel, tmx_names) for each listed folder in pre-order, and
+    the (path, rel) of the folders still to list, in the order they follow.
+    """
+    stack = list(reversed(roots))
+    listed = []
+    while stack and len(listed) < SCAN_BATCH_DIRS and not stop.is_set():
+        path, rel = stack.pop()
+        listing = list_dir(path, rel)
+        tmx_names, children = _expand(path, rel, listing.tmx_names, listing.subdirs, ignore)
+        listed.append((path, rel, tmx_names))
+        stack.extend(reversed(children))
+    return listed, stack[::-1]
+
+
+def _chunks(items, count):
+    """Split items into at most count consecutive, nearly equal lists."""
+    size = -(-len(items) // count)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def iter_tmx_dirs(root_dir, directories, workers=None, cache=None, ignore=None, profiler=None):
+    """Yield a ScannedDir for every folder below the given directories.
+
+    Folders are yielded in a fixed order (each folder before its subfolders,
+    names sorted), so the output is the same for any number of workers. With
+    more than one worker, subtrees are listed in batches of SCAN_BATCH_DIRS
+    folders by a pool of threads, ahead of the caller. Unchanged folders are
+    taken from cache (a ScanCache) when one is given; the threads are only
+    used for folders that must really be listed. Folders and files excluded
+    by ignore (an IgnoreRules) are skipped. Every listing is recorded in
+    profiler (a Profiler), if one is given.
+    """
+    if workers is None:
+        workers = default_scan_workers()
+    if cache is not None:
+        list_dir = cache.list_dir
+    else:
+        list_dir = lambda path, rel: _list_tmx_dir(path)
+    lookup = cache.lookup if cache is not None else lambda path, rel: None
+    if profiler:
+        list_dir = profiler.timed(list_dir)
+        lookup = profiler.timed(lookup)
+
+    roots = []
+    for index, directory in enumerate(directories):
+        rel = os.path.relpath(directory, root_dir).replace("\\", "/")
+        roots.append((index, directory, "" if rel == "." else rel))
+
+    if workers <= 1:
+        for index, directory, rel in roots:
+            stack = [(directory, rel)]
+            while stack:
+                path, rel = stack.pop()
+                listing = list_dir(path, rel)
+                tmx_names, children = _expand(path, rel, listing.tmx_names, listing.subdirs, ignore)
+                stack.extend(reversed(children))
+                yield ScannedDir(index, path, rel, tmx_names)
+        return
+
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=workers)
+
+    def schedule(index, folders):
+        """Return stack items for folders: cached listings, resolved right
+        away with a stat call, and tasks listing the rest in the pool."""
+        items = []
+        misses = []
+        for path, rel in folders:
+            listing = lookup(path, rel)
+            if listing is None:
+                misses.append((path, rel))
+                continue
+            if misses:
+                items.extend(submit(index, misses))
+                misses = []
+            items.append((index, None, (path, rel, listing)))
+        if misses:
+            items.extend(submit(index, misses))
+        return items
+
+    def submit(index, folders):
+        # One task per worker, each with a consecutive run of the folders
+        return [(index, pool.submit(_scan_task, chunk, stop, list_dir, ignore), None)
+                for chunk in _chunks(folders, workers)]
+
+    try:
+        stack = []
+        for index, directory, rel in reversed(roots):
+            stack.extend(reversed(schedule(index, [(directory, rel)])))
+        while stack:
+            index, future, cached = stack.pop()
+            if future is None:
+                path, rel, listing = cached
+                tmx_names, children = _expand(path, rel, listing.tmx_names, listing.subdirs, ignore)
+                stack.extend(reversed(schedule(index, children)))
+                yield ScannedDir(index, path, rel, tmx_names)
+                continue
+            listed, remaining = future.result()
+            # The rest of the batch is scheduled when the batch is reached, so
+            # the listings waiting in memory are bounded by the shape of the
+            # tree, not its size
+            if remaining:
+                stack.extend(reversed(schedule(index, remaining)))
+            for path, rel, tmx_names in listed:
+                yield ScannedDir(index, path, rel, tmx_names)
+    finally:
+        # Let queued listings return immediately if the caller stopped early
+        stop.set()
+        pool.shutdown(wait=True)
+
+
+def scan(root_dir, directories, workers=None, cache=None, progress=None, ignore=None, profiler=None):
+    """Yield the path of every .tmx file, relative to root_dir, as it is found.
+
+    Paths use "/" and come in the order described in iter_tmx_dirs(). A
+    "folder" ProgressEvent is passed to progress after each folder is listed.
+    The cache is not saved; call cache.save() when done.
+    """
+    total = len(directories)
+    for scanned in iter_tmx_dirs(root_dir, directories, workers, cache, ignore, profiler):
+        if progress is not None:
+            progress(ProgressEvent("folder", scanned.path, scanned.index, total, len(scanned.tmx_names)))
+        prefix = f"{scanned.rel}/" if scanned.rel else ""
+        for name in scanned.tmx_names:
+            yield prefix + name
+
+
+class _Inotify:
+    """Minimal ctypes wrapper around Linux inotify, used by watch mode."""
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    MASK = (IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+            | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        # IN_NONBLOCK and IN_CLOEXEC share their values with the O_ flags
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wds = {}    # path -> watch descriptor
+        self._paths = {}  # watch descriptor -> path
+
+    @classmethod
+    def create(cls):
+        """Return an inotify instance, or None where inotify isn't available."""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            return cls()
+        except (OSError, AttributeError, TypeError):
+            return None
+
+    def watch(self, paths):
+        """Watch exactly the given folders.
+
+        Returns False if the system limit on watches was reached, in which
+        case the caller should fall back to polling.
+        """
+        paths = set(paths)
+        for path in list(self._wds):
+            if path not in paths:
+                # Deleted folders drop their watch by themselves; just forget the path
+                self._paths.pop(self._wds.pop(path), None)
+        for path in paths:
+            if path in self._wds:
+                continue
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+            if wd < 0:
+                if ctypes.get_errno() == errno.ENOSPC:
+                    return False
+                continue  # The folder vanished since it was listed
+            self._wds[path] = wd
+            self._paths[wd] = path
+        return True
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for events; returns True if any arrived."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size + length
+                changed = True
+                if mask & self.IN_IGNORED:
+                    # The watch is gone (folder deleted); re-add it if the folder comes back
+                    path = self._paths.pop(wd, None)
+                    if path is not None:
+                        self._wds.pop(path, None)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watch(root_dir, directories, on_change, tmx_files=None, interval=1.0, debounce=0.5,
+          workers=None, cache=None, stop=None, use_inotify=True, ignore=None, profiler=NULL_PROFILER):
+    """Call on_change(tmx_files) whenever the set of .tmx files changes.
+
+    The folders are rescanned after inotify reports a change (debounced
+    until events stop for debounce seconds), or every interval seconds when
+    inotify is unavailable. Rescans go through cache, so only folders that
+    changed are listed again; ignore is passed on to iter_tmx_dirs(), so
+    excluded folders aren't watched either. tmx_files is the last known
+    result, if any; otherwise on_change is also called for the first scan.
+    Every rescan is timed as a "scan" stage of profiler. Runs until stop (a
+    threading.Event) is set.
+    """
+    if cache is None:
+        cache = ScanCache(root_dir)
+    if stop is None:
+        stop = threading.Event()
+    notifier = _Inotify.create() if use_inotify else None
+    known = None if tmx_files is None else set(tmx_files)
+    candidate = None
+    try:
+        while not stop.is_set():
+            cache.reset()
+            scanned_dirs = []
+            tmx_files = []
+            with profiler.stage("scan"):
+                for scanned in iter_tmx_dirs(root_dir, directories, workers, cache, ignore, profiler):
+                    scanned_dirs.append(scanned.path)
+                    prefix = f"{scanned.rel}/" if scanned.rel else ""
+                    tmx_files.extend(prefix + name for name in scanned.tmx_names)
+
+            if notifier and not notifier.watch(scanned_dirs):
+                # Too many folders for the inotify watch limit
+                notifier.close()
+                notifier = None
+
+            current = set(tmx_files)
+            if current != known:
+                # When polling, wait until two scans agree so half-copied batches settle first
+                if known is None or notifier or current == candidate:
+                    known = current
+                    candidate = None
+                    on_change(tmx_files)
+                else:
+                    candidate = current
+                    stop.wait(debounce)
+                    continue
+            candidate = None
+
+            if notifier:
+                while not stop.is_set() and not notifier.wait(interval):
+                    pass
+                while not stop.is_set() and notifier.wait(debounce):
+                    pass
+            else:
+                stop.wait(interval)
+    finally:
+        if notifier:
+            notifier.close()
+
+
+# Result of merging rule lists: the merged rules plus how many entries were
+# new, repeated within their own list, and kept but not found by the scan
+MergeResult = namedtuple("MergeResult", "rules added duplicates stale")
+
+
+def rule_key(rule, nfc=False):
+    """Normalised form of a rules.txt entry, used to find duplicates.
+
+    Slashes are unified, "./" segments and repeated slashes are removed and
+    case is folded; with nfc=True the key is also Unicode NFC normalised so
+    composed and decomposed accents compare equal.
+    """
+    key = rule.replace("\\", "/")
+    if "./" in key or "//" in key:
+        parts = [part for part in key.split("/") if part not in ("", ".")]
+        key = ("/" if key.startswith("/") else "") + "/".join(parts)
+    if nfc:
+        key = unicodedata.normalize("NFC", key)
+    return key.casefold()
+
+
+def compact_key(rule, nfc=False):
+    """Fixed-size digest of rule_key(), used to find duplicates in big rule lists.
+
+    A 16 byte BLAKE2b digest takes less memory than the normalised path and
+    doesn't grow with it; collisions are not a practical concern.
+    """
+    return hashlib.blake2b(rule_key(rule, nfc).encode("utf-8"), digest_size=16).digest()
+
+
+class MergeStream:
+    """Iterator over the merge of existing rules and scanned files, see merge().
+
+    Both inputs are consumed lazily, so rules can flow from scan() straight
+    into write() without being collected in lists. Only one compact_key() per
+    distinct entry is kept. The counts are final once the stream has been
+    exhausted: count (rules yielded), added, duplicates and stale.
+    """
+    def __init__(self, existing_rules, tmx_files, nfc=False):
+        self._existing_rules = existing_rules
+        self._tmx_files = tmx_files
+        self._nfc = nfc
+        self.count = 0
+        self.added = 0
+        self.duplicates = 0
+        self.stale = 0
+
+    def __iter__(self):
+        nfc = self._nfc
+        # Existing entries not found by the scan yet; they move to seen when
+        # found, so every key is stored only once
+        pending = set()
+        for rule in self._existing_rules:
+            key = compact_key(rule, nfc)
+            if key in pending:
+                self.duplicates += 1
+                continue
+            pending.add(key)
+            self.count += 1
+            yield rule
+
+        seen = set()
+        for tmx_file in self._tmx_files:
+            key = compact_key(tmx_file, nfc)
+            if key in pending:
+                pending.remove(key)
+                seen.add(key)
+            elif key in seen:
+                self.duplicates += 1
+            else:
+                seen.add(key)
+                self.count += 1
+                self.added += 1
+                yield tmx_file
+        self.stale = len(pending)
+
+    def result(self, rules=None):
+        """Return the counts as a MergeResult holding the given rules list."""
+        return MergeResult(rules, self.added, self.duplicates, self.stale)
+
+
+def merge(existing_rules, tmx_files, nfc=False):
+    """Append the scanned files that aren't listed yet to the existing rules.
+
+    Runs in linear time using a set of normalised keys, keeps the first
+    spelling of every entry in its original order, and drops repeated
+    entries from both lists. Returns a MergeResult; use MergeStream to
+    merge without building the list.
+    """
+    stream = MergeStream(existing_rules, tmx_files, nfc)
+    return stream.result(list(stream))
+
+
+def kept_rules(existing_rules, tmx_files, root_dir, directories, nfc=False):
+    """Yield the existing entries that are still valid after a scan, in their original order.
+
+    Rule maps inside the scanned directories are only kept while tmx_files,
+    the list of scanned files, still has them; other entries, such as
+    includes of other rules.txt files or rule maps elsewhere, are always
+    kept. Merging the result with tmx_files updates a rules.txt without
+    losing its hand-set order.
+    """
+    prefixes = _scan_prefixes(root_dir, directories, nfc)
+    found = set(compact_key(tmx_file, nfc) for tmx_file in tmx_files)
+    for rule in existing_rules:
+        if not _scannable(rule_key(rule, nfc), prefixes) or compact_key(rule, nfc) in found:
+            yield rule
+
+
+def _scan_prefixes(root_dir, directories, nfc=False):
+    """rule_key() prefixes of the rule maps a scan of directories can find."""
+    prefixes = []
+    for directory in directories:
+        rel = os.path.relpath(directory, root_dir).replace("\\", "/")
+        prefixes.append("" if rel == "." else rule_key(rel, nfc) + "/")
+    return prefixes
+
+
+def _scannable(key, prefixes):
+    return key.endswith(".tmx") and any(key.startswith(prefix) for prefix in prefixes)
+
+
+# Difference between a rules.txt and what would be written to it: the
+# entries that would be added and those that would be removed
+RulesDiff = namedtuple("RulesDiff", "added removed")
+
+
+def diff(existing_rules, tmx_files, mode="add", nfc=False):
+    """Compare existing rules with the scanned files, as generate() would merge them.
+
+    Entries are compared as sets of compact_key(), in linear time; their order
+    is ignored, so use up_to_date() to tell whether the file would change.
+    With mode "add" existing entries are kept, so nothing is ever removed.
+    Both lists of the RulesDiff keep the order of their input.
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r}, expected one of {', '.join(MODES)}")
+    existing = {}
+    for rule in existing_rules:
+        existing.setdefault(compact_key(rule, nfc), rule)
+    found = set()
+    added = []
+    for tmx_file in tmx_files:
+        key = compact_key(tmx_file, nfc)
+        if key in found:
+            continue
+        found.add(key)
+        if key not in existing:
+            added.append(tmx_file)
+    removed = [] if mode == "add" else [rule for key, rule in existing.items() if key not in found]
+    return RulesDiff(added, removed)
+
+
+# Contents of a rules.txt file as read from disk: the raw bytes, the
+# non-empty stripped lines, and the stat values used to tell if it changed
+RulesSnapshot = namedtuple("RulesSnapshot", "path data rules mtime_ns size")
+
+# Buffer size for the single stream used to write rules.txt
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+def read(path, snapshot=None):
+    """Read a rules.txt file once, returning a RulesSnapshot or None if it doesn't exist.
+
+    A previous snapshot is returned as is when the file hasn't changed since,
+    so the file is not read again.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if snapshot is not None and snapshot.path == path and (snapshot.mtime_ns, snapshot.size) == (st.st_mtime_ns, st.st_size):
+        return snapshot
+    with open(path, "rb") as rules_file:
+        data = rules_file.read()
+    rules = [line.strip() for line in data.decode("utf-8").splitlines() if line.strip()]
+    return RulesSnapshot(path, data, rules, st.st_mtime_ns, st.st_size)
+
+
+def iter_rules(path):
+    """Yield the non-empty stripped lines of a rules.txt file one at a time.
+
+    Yields nothing if the file doesn't exist. Unlike read(), the file is
+    never held in memory as a whole.
+    """
+    try:
+        rules_file = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return
+    with rules_file:
+        for line in rules_file:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def _fsync_dir(directory):
+    """Flush a folder entry to disk where the platform allows it."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # Not supported on Windows
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def up_to_date(path, rules):
+    """Return True if write(path, rules) would leave path as it is.
+
+    The rules are encoded as write() encodes them and compared with the file
+    byte for byte while they stream in, so order, duplicates and line
+    endings count, and nothing is written. Returns False if path doesn't
+    exist.
+    """
+    try:
+        existing_file = open(path, "rb", buffering=WRITE_BUFFER_SIZE)
+    except FileNotFoundError:
+        return False
+    with existing_file:
+        for rule in rules:
+            line = f"{rule}\n".encode("utf-8")
+            if existing_file.read(len(line)) != line:
+                return False
+        return not existing_file.read(1)
+
+
+def write(path, rules, existing_data=None, backup_path=None, progress=None):
+    """Atomically replace path with the given rules, one per line.
+
+    The rules (any iterable) are streamed to a temporary file in the same
+    folder, flushed to disk and moved into place with os.replace, so readers
+    never see a partly written file. While writing they are compared with
+    existing_data, or with the current file when no data is given; if the
+    result is byte-identical, nothing is changed and False is returned.
+    Otherwise the old file is kept at backup_path (as a hard link when
+    possible) and True is returned.
+    A "write" ProgressEvent is passed to progress once the rules are written.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".rules.", suffix=".tmp", dir=directory)
+    try:
+        if existing_data is not None:
+            existing_file = io.BytesIO(existing_data)
+        else:
+            try:
+                existing_file = open(path, "rb", buffering=WRITE_BUFFER_SIZE)
+            except OSError:
+                existing_file = None
+        same = existing_file is not None
+        count = 0
+        with contextlib.ExitStack() as stack:
+            if existing_file is not None:
+                stack.enter_context(existing_file)
+            tmp_file = stack.enter_context(os.fdopen(fd, "wb", buffering=WRITE_BUFFER_SIZE))
+            for rule in rules:
+                count += 1
+                line = f"{rule}\n".encode("utf-8")
+                if same:
+                    same = existing_file.read(len(line)) == line
+                tmp_file.write(line)
+            if same and not existing_file.read(1):
+                unchanged = True
+            else:
+                unchanged = False
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+        if unchanged:
+            os.remove(tmp_path)
+            if progress is not None:
+                progress(ProgressEvent("write", path, None, None, count))
+            return False
+
+        # mkstemp creates private files; give the new file the usual permissions
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_path, 0o666 & ~umask)
+
+        if backup_path and os.path.exists(path):
+            # The old file is replaced, not modified, so a hard link is a full backup
+            try:
+                os.link(path, backup_path)
+            except OSError:
+                shutil.copyfile(path, backup_path)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(directory)
+    if progress is not None:
+        progress(ProgressEvent("write", path, None, None, count))
+    return True
+
+
+# How generate() lays out the rules: one rules.txt listing every rule map,
+# or a rules.txt per rule folder included from the main rules.txt
+LAYOUTS = ("flat", "tree")
+
+# File in a rule folder listing the names of its rule maps and subfolders
+# that should come first in its rules.txt, in that order
+ORDER_FILENAME = ".rulesorder"
+
+# Outcome of writing one file of the "tree" layout: its path and the same
+# counts as a GenerateResult
+TreeFileResult = namedtuple("TreeFileResult", "path rules added duplicates stale written")
+
+_DIGITS_RE = re.compile(r"(\d+)")
+
+
+def natural_key(name):
+    """Sort key that compares the numbers in name by value, so "map9" comes before "map10".
+
+    Case is ignored, with the name itself breaking ties.
+    """
+    parts = _DIGITS_RE.split(name.casefold())
+    # split() alternates text and digits, so numbers are always at odd indices
+    return [int(part) if i % 2 else part for i, part in enumerate(parts)], name
+
+
+def read_order(directory):
+    """Return the names listed in the folder's .rulesorder file, or [] if it has none.
+
+    Blank lines and lines starting with "#" are ignored; a trailing "/" on
+    folder names is optional.
+    """
+    try:
+        with open(os.path.join(directory, ORDER_FILENAME), encoding="utf-8") as order_file:
+            lines = order_file.read().splitlines()
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    return [line.strip().rstrip("/") for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _entry_name(entry):
+    """Name of the rule map or subfolder a rules.txt entry of the tree layout refers to."""
+    return entry.split("/", 1)[0]
+
+
+def order_entries(directory, entries):
+    """Sort the entries of a folder's rules.txt naturally, honouring its .rulesorder file."""
+    entries = sorted(entries, key=lambda entry: natural_key(_entry_name(entry)))
+    order = read_order(directory)
+    if not order:
+        return entries
+    rank = {}
+    for position, name in enumerate(order):
+        rank.setdefault(name.casefold(), position)
+    # sorted() is stable, so unlisted entries keep their natural order after the listed ones
+    return sorted(entries, key=lambda entry: rank.get(_entry_name(entry).casefold(), len(order)))
+
+
+def build_tree(root_dir, directories, tmx_files):
+    """Group rule files into one rules.txt per folder for the "tree" layout.
+
+    Every rule folder containing rule maps, directly or below it, gets a
+    rules.txt listing its own maps and the rules.txt of its subfolders,
+    ordered with order_entries(). The main rules.txt includes the rules.txt
+    of each directory in the order given (or is the directory's own file when
+    root_dir itself was selected). Returns a dict mapping each folder, relative
+    to root_dir with "" for root_dir, to the entries of its rules.txt.
+    """
+    tops = []
+    for directory in directories:
+        rel = os.path.relpath(directory, root_dir).replace("\\", "/")
+        tops.append("" if rel == "." else rel)
+
+    def inside(rel, top):
+        return top == "" or rel == top or rel.startswith(top + "/")
+
+    # Folders inside another selected folder are already included by it
+    tops = [rel for i, rel in enumerate(tops)
+            if rel not in tops[:i] and not any(other != rel and inside(rel, other) for other in tops)]
+
+    children = {}
+    for tmx_file in tmx_files:
+        top = next((top for top in tops if inside(tmx_file, top)), None)
+        if top is None:
+            continue
+        folder, _, entry = tmx_file.rpartition("/")
+        while True:
+            linked = folder in children
+            children.setdefault(folder, set()).add(entry)
+            # Once a folder is known, it is already linked to its parents
+            if linked or folder == top:
+                break
+            folder, _, name = folder.rpartition("/")
+            entry = f"{name}/rules.txt"
+
+    tree = {folder: order_entries(os.path.join(root_dir, folder), entries)
+            for folder, entries in children.items()}
+    if "" not in tops:
+        tree[""] = [f"{top}/rules.txt" for top in tops if top in children]
+    return tree
+
+
+def tree_conflicts(root_dir, directories, tree, nfc=False):
+    """Return the rule maps listed in the main rules.txt that the tree layout lists in per-folder files.
+
+    Adding the tree layout's includes to such a file (a flat rules.txt made
+    before) would list these maps twice.
+    """
+    prefixes = _scan_prefixes(root_dir, directories, nfc)
+    expected = set(rule_key(rule, nfc) for rule in tree.get("", ()))
+    conflicts = []
+    for rule in iter_rules(os.path.join(root_dir, "rules.txt")):
+        key = rule_key(rule, nfc)
+        if _scannable(key, prefixes) and key not in expected:
+            conflicts.append(rule)
+    return conflicts
+
+
+def tree_files(root_dir, tree):
+    """Yield (folder, path) for the files of a build_tree() result, in the order write_tree() writes them.
+
+    Subfolders come before the files including them, the main rules.txt last.
+    """
+    for folder in sorted(tree, key=lambda folder: (-folder.count("/"), folder == "", folder)):
+        yield folder, os.path.join(root_dir, folder, "rules.txt")
+
+
+def tree_rules(root_dir, tree, mode="add", nfc=False):
+    """Yield (folder, path, rules) for every file write_tree() writes, in its order.
+
+    rules is the MergeStream write_tree() streams into path: the build_tree()
+    entries, merged with the existing main rules.txt when mode is "add".
+    """
+    for folder, path in tree_files(root_dir, tree):
+        existing_rules = iter_rules(path) if folder == "" and mode == "add" else []
+        yield folder, path, MergeStream(existing_rules, tree[folder], nfc)
+
+
+def write_tree(root_dir, tree, mode="add", nfc=False, progress=None):
+    """Write the rules.txt files of a build_tree() result.
+
+    The rules.txt of the rule folders belong to the generator, so they are
+    always written exactly as build_tree() orders them. mode only applies
+    to the main rules.txt, which is merged and written like the flat one:
+    "add" keeps its existing entries, "overwrite" replaces them and "backup"
+    also keeps the old file next to it. Files whose content doesn't change
+    aren't touched, so only the folders that changed are rewritten. Returns
+    a TreeFileResult per file, main rules.txt last. Use tree_conflicts()
+    first when adding to a rules.txt that may have been flat.
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r}, expected one of {', '.join(MODES)}")
+    results = []
+    for folder, path, merged in tree_rules(root_dir, tree, mode, nfc):
+        backup_path = None
+        if folder == "" and mode == "backup" and os.path.exists(path):
+            backup_path = os.path.join(root_dir, backup_name())
+        # write() compares with the current file, so unchanged files keep their bytes
+        written = write(path, merged, None, backup_path, progress)
+        results.append(TreeFileResult(path, merged.count, merged.added, merged.duplicates,
+                                      merged.stale, written))
+    return results
+
+
+# Outcome of validating one rule map: its path as given, whether Tiled can
+# use it as a rule map, and the reason when it can't
+ValidationResult = namedtuple("ValidationResult", "path valid reason")
+
+# Elements whose content is no longer needed once parsed; cleared to keep
+# memory flat while streaming through big maps
+_DISCARDED_TAGS = frozenset(("layer", "objectgroup", "imagelayer", "group", "tileset", "data", "properties"))
+
+# Files validated in one batch by a worker process
+VALIDATE_CHUNK_SIZE = 32
+
+
+def validate_rule_map(path):
+    """Check that a .tmx file has the layers Tiled needs in a rule map.
+
+    A rule map needs at least one tile layer named input* and one tile or
+    object layer named output* (regions* layers are optional). The file is
+    streamed with iterparse and reading stops as soon as both are found, so
+    large maps are not loaded in full. Returns a ValidationResult.
+    """
+    has_input = has_output = False
+    try:
+        with open(path, "rb") as map_file:
+            root_seen = False
+            for event, elem in ET.iterparse(map_file, events=("start", "end")):
+                if event == "end":
+                    if elem.tag in _DISCARDED_TAGS:
+                        elem.clear()
+                    continue
+                if not root_seen:
+                    if elem.tag != "map":
+                        return ValidationResult(path, False, "not a Tiled map")
+                    root_seen = True
+                elif elem.tag in ("layer", "objectgroup"):
+                    # Tiled matches these prefixes case-insensitively
+                    name = elem.get("name", "").lower()
+                    if name.startswith("input") and elem.tag == "layer":
+                        has_input = True
+                    elif name.startswith("output"):
+                        has_output = True
+                    if has_input and has_output:
+                        return ValidationResult(path, True, None)
+    except ET.ParseError as e:
+        return ValidationResult(path, False, f"not valid XML ({e})")
+    except OSError as e:
+        return ValidationResult(path, False, f"can't be read ({e.strerror or e})")
+    if has_input:
+        return ValidationResult(path, False, "no output layer")
+    if has_output:
+        return ValidationResult(path, False, "no input layer")
+    return ValidationResult(path, False, "no input or output layers")
+
+
+class ValidationCache:
+    """On-disk record of validate_rule_map() results, keyed on file mtime and size.
+
+    Works like ScanCache: unchanged files are never parsed twice, and only
+    the files seen in the last run are kept when saving.
+    """
+    VERSION = 1
+    FILENAME = ".rules_validation_cache.json"
+
+    def __init__(self, root_dir):
+        self.path = os.path.join(root_dir, self.FILENAME)
+        self._old = {}
+        self._new = {}
+
+    @classmethod
+    def load(cls, root_dir):
+        """Load the cache for root_dir, starting empty if it is missing or unusable."""
+        cache = cls(root_dir)
+        try:
+            with open(cache.path, "r", encoding="utf-8") as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError):
+            return cache
+        if isinstance(data, dict) and data.get("version") == cls.VERSION and isinstance(data.get("files"), dict):
+            cache._old = data["files"]
+        return cache
+
+    def get(self, rel, st):
+        """Return the cached ValidationResult for an unchanged file, or None."""
+        entry = self._old.get(rel)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            self._new[rel] = entry
+            return ValidationResult(rel, entry[2], entry[3])
+        return None
+
+    def put(self, rel, st, result):
+        if time.time_ns() - st.st_mtime_ns > ScanCache.RACY_NS:
+            self._new[rel] = [st.st_mtime_ns, st.st_size, result.valid, result.reason]
+
+    def save(self):
+        """Write the files seen in this run back to disk, dropping the rest."""
+        data = {"version": self.VERSION, "files": self._new}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as cache_file:
+                json.dump(data, cache_file, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def validate(root_dir, tmx_files, processes=None, cache=None):
+    """Validate rule maps given by paths relative to root_dir, in parallel.
+
+    Files are parsed by a pool of processes (processes=1 parses in this
+    process); results from cache (a ValidationCache) are used for unchanged
+    files and the cache is updated, but not saved. Returns a list with a
+    ValidationResult for each file, in order, using the relative paths.
+    """
+    results = [None] * len(tmx_files)
+    todo = []
+    for number, rel in enumerate(tmx_files):
+        full_path = os.path.join(root_dir, rel)
+        try:
+            st = os.stat(full_path)
+        except OSError as e:
+            results[number] = ValidationResult(rel, False, f"can't be read ({e.strerror or e})")
+            continue
+        cached = cache.get(rel, st) if cache is not None else None
+        if cached is not None:
+            results[number] = cached
+        else:
+            todo.append((number, rel, full_path, st))
+
+    paths = [full_path for _, _, full_path, _ in todo]
+    if processes == 1 or len(todo) <= VALIDATE_CHUNK_SIZE:
+        # Not worth starting processes for a handful of files
+        parsed = list(map(validate_rule_map, paths))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            parsed = list(pool.map(validate_rule_map, paths, chunksize=VALIDATE_CHUNK_SIZE))
+
+    for (number, rel, _, st), result in zip(todo, parsed):
+        result = result._replace(path=rel)
+        results[number] = result
+        if cache is not None:
+            cache.put(rel, st, result)
+    return results
+
+
+# Summary of a generate() run: the rules.txt path, the number of rules in it,
+# the MergeResult counts, whether the file was actually rewritten, and the
+# ValidationResult of every invalid rule map (when validating)
+GenerateResult = namedtuple("GenerateResult", "path rules added duplicates stale written invalid")
+
+# What generate() does with rule maps that fail validation
+VALIDATE_MODES = ("report", "exclude")
+
+# What generate() does with an existing rules.txt
+MODES = ("add", "overwrite", "backup")
+
+
+def backup_name(now=None):
+    """File name for a backup of rules.txt made at the given time (default: now)."""
+    return f"rules_backup_{(now or datetime.now()).strftime('%Y%m%d_%H%M%S')}.txt"
+
+
+def generate(root_dir, directories, mode="add", nfc=False, workers=None, cache=None, progress=None,
+             validation=None, processes=None, validation_cache=None, ignore=None, profiler=NULL_PROFILER,
+             layout="flat"):
+    """Scan the directories and write root_dir/rules.txt in one go.
+
+    mode is "add" (keep existing entries and append new ones), "overwrite"
+    or "backup" (overwrite, keeping the old file as a timestamped backup).
+    layout "tree" writes a rules.txt per rule folder (see build_tree()), in
+    which case the counts of the result are summed over all files.
+    validation is None, "report" (validate the rule maps and report invalid
+    ones in the result) or "exclude" (also leave them out of rules.txt);
+    processes and validation_cache are passed on to validate(), and ignore
+    (an IgnoreRules) to scan(). Each step is timed as a stage of profiler.
+    Raises ValueError for an unknown mode, when adding the tree layout to a
+    flat rules.txt (see tree_conflicts()) and when no rule maps are left to
+    overwrite rules.txt with, and OSError or
+    UnicodeDecodeError if the files can't be read or written. Returns a
+    GenerateResult.
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r}, expected one of {', '.join(MODES)}")
+    if validation is not None and validation not in VALIDATE_MODES:
+        raise ValueError(f"unknown validation {validation!r}, expected one of {', '.join(VALIDATE_MODES)}")
+    if layout not in LAYOUTS:
+        raise ValueError(f"unknown layout {layout!r}, expected one of {', '.join(LAYOUTS)}")
+    rules_path = os.path.join(root_dir, "rules.txt")
+    tmx_files = scan(root_dir, directories, workers, cache, progress, ignore, profiler)
+    if profiler or validation is not None or layout == "tree":
+        # Finish the scan first, so its time isn't counted as part of the merge;
+        # otherwise the files are streamed without being collected
+        with profiler.stage("scan"):
+            tmx_files = list(tmx_files)
+    invalid = []
+    if validation is not None:
+        with profiler.stage("validate"):
+            invalid = [result for result in validate(root_dir, tmx_files, processes, validation_cache)
+                       if not result.valid]
+            if validation == "exclude" and invalid:
+                excluded = set(result.path for result in invalid)
+                tmx_files = [tmx_file for tmx_file in tmx_files if tmx_file not in excluded]
+            if validation_cache is not None:
+                validation_cache.save()
+    if isinstance(tmx_files, list):
+        found = bool(tmx_files)
+    else:
+        # Take the first file before the writer opens rules.txt
+        first = next(tmx_files, None)
+        found = first is not None
+        if found:
+            tmx_files = itertools.chain([first], tmx_files)
+    if not found and mode != "add":
+        raise ValueError(f"no rule maps found, refusing to {mode} {rules_path} with an empty file")
+    if layout == "tree":
+        with profiler.stage("write"):
+            tree = build_tree(root_dir, directories, tmx_files)
+            if mode == "add":
+                conflicts = tree_conflicts(root_dir, directories, tree, nfc)
+                if conflicts:
+                    raise ValueError(f"{rules_path} lists {len(conflicts)} rule maps that the tree layout "
+                                     "includes from per-folder files; use mode 'overwrite' or 'backup' to switch")
+            files = write_tree(root_dir, tree, mode, nfc, progress)
+        if cache is not None:
+            with profiler.stage("cache"):
+                cache.save()
+        return GenerateResult(rules_path, sum(f.rules for f in files), sum(f.added for f in files),
+                              sum(f.duplicates for f in files), sum(f.stale for f in files),
+                              any(f.written for f in files), invalid)
+    # Stream the existing rules and the scan through the merge into the
+    # writer, which compares with the old file as it goes, so memory stays
+    # at one compact key per rule
+    merged = MergeStream(iter_rules(rules_path) if mode == "add" else (), tmx_files, nfc)
+    rules = merged
+    if profiler:
+        with profiler.stage("merge"):
+            rules = list(merged)
+    backup_path = None
+    if mode == "backup" and os.path.exists(rules_path):
+        backup_path = os.path.join(root_dir, backup_name())
+    with profiler.stage("write"):
+        written = write(rules_path, rules, None, backup_path, progress)
+    if cache is not None:
+        with profiler.stage("cache"):
+            cache.save()
+    return GenerateResult(rules_path, merged.count, merged.added, merged.duplicates,
+                          merged.stale, written, invalid)
+
+
+# One project for generate_many(): its main folder, its rule folders relative
+# to that folder, and the generate() mode to use
+ProjectSpec = namedtuple("ProjectSpec", "root dirs mode")
+
+# Outcome of one project in generate_many(): a GenerateResult, or None and an
+# error message
+ProjectResult = namedtuple("ProjectResult", "root result error")
+
+# Extension of Tiled project files, used to discover project folders
+PROJECT_EXTENSION = ".tiled-project"
+
+# Threads each project uses to list folders in generate_many()
+BATCH_SCAN_WORKERS = 4
+
+
+def _load_toml(path):
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ValueError("TOML manifests need Python 3.11 or the tomli package; use JSON instead") from None
+    with open(path, "rb") as manifest_file:
+        return tomllib.load(manifest_file)
+
+
+def _manifest_dirs(value, path, where):
+    """Return a manifest "dirs" value as a list, accepting a single folder name too."""
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, (list, tuple)) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"{path}: {where} has invalid 'dirs' {value!r}, expected a list of folder names")
+    return list(value)
+
+
+def load_manifest(path, mode="add", dirs=()):
+    """Read a JSON or TOML (.toml) manifest and return its list of ProjectSpec.
+
+    The manifest has a "projects" list whose entries give a "root" and
+    optionally "dirs" and "mode"; top-level "dirs" and "mode" keys set the
+    defaults, falling back to the mode and dirs arguments. "dirs" is a list of
+    folder names or a single name. Relative roots are resolved against the
+    manifest's folder. Raises ValueError for an invalid manifest.
+    """
+    if path.lower().endswith(".toml"):
+        data = _load_toml(path)
+    else:
+        with open(path, "r", encoding="utf-8") as manifest_file:
+            data = json.load(manifest_file)
+    if not isinstance(data, dict) or not isinstance(data.get("projects"), list):
+        raise ValueError(f"{path}: expected a top-level 'projects' list")
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    default_mode = data.get("mode", mode)
+    default_dirs = _manifest_dirs(data.get("dirs", list(dirs)), path, "the manifest")
+    projects = []
+    for number, entry in enumerate(data["projects"], 1):
+        if isinstance(entry, str):
+            entry = {"root": entry}
+        if not isinstance(entry, dict) or not entry.get("root"):
+            raise ValueError(f"{path}: project {number} has no 'root'")
+        if not isinstance(entry["root"], str):
+            raise ValueError(f"{path}: project {number} has invalid 'root' {entry['root']!r}, "
+                             "expected a folder path")
+        project_dirs = _manifest_dirs(entry.get("dirs", default_dirs), path,
+                                      f"project {number} ({entry['root']})")
+        project_mode = entry.get("mode", default_mode)
+        if not project_dirs:
+            raise ValueError(f"{path}: project {number} has no rule 'dirs'")
+        if project_mode not in MODES:
+            raise ValueError(f"{path}: project {number} has unknown mode {project_mode!r}")
+        projects.append(ProjectSpec(os.path.join(base_dir, entry["root"]), project_dirs, project_mode))
+    return projects
+
+
+def discover_projects(base_dir, dirs, mode="add"):
+    """Find Tiled projects below base_dir and return a ProjectSpec for each.
+
+    A project is a folder containing a *.tiled-project file; its subfolders
+    are not searched for further projects, and hidden folders are skipped.
+    Every project uses the same rule folders, dirs.
+    """
+    projects = []
+    stack = [base_dir]
+    while stack:
+        path = stack.pop()
+        subdirs = []
+        is_project = False
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.name.endswith(PROJECT_EXTENSION) and entry.is_file():
+                        is_project = True
+                    elif entry.is_dir(follow_symlinks=False) and not entry.name.startswith("."):
+                        subdirs.append(entry.path)
+        except OSError:
+            continue
+        if is_project:
+            projects.append(ProjectSpec(path, list(dirs), mode))
+        else:
+            stack.extend(sorted(subdirs, reverse=True))
+    projects.sort(key=lambda project: project.root)
+    return projects
+
+
+# Per-storage-device semaphores of a generate_many() worker process
+_io_slots = {}
+
+
+def _init_batch_worker(io_slots):
+    global _io_slots
+    _io_slots = io_slots
+
+
+def _generate_project(project, nfc, use_cache, device, validation, excludes, includes, layout):
+    """Run generate() for one project, turning failures into a ProjectResult."""
+    try:
+        directories = []
+        for subdir in project.dirs:
+            full_path = os.path.join(project.root, subdir)
+            if not os.path.isdir(full_path):
+                raise FileNotFoundError(f"rule folder '{subdir}' doesn't exist")
+            directories.append(full_path)
+        slot = _io_slots.get(device)
+        if slot is not None:
+            slot.acquire()
+        try:
+            cache = ScanCache.load(project.root) if use_cache else None
+            validation_cache = ValidationCache.load(project.root) if use_cache and validation else None
+            ignore = IgnoreRules.load(project.root, excludes, includes)
+            # Projects already run in parallel, so validate each one in its own process
+            result = generate(project.root, directories, project.mode, nfc, BATCH_SCAN_WORKERS, cache,
+                              validation=validation, processes=1, validation_cache=validation_cache,
+                              ignore=ignore, layout=layout)
+        finally:
+            if slot is not None:
+                slot.release()
+        return ProjectResult(project.root, result, None)
+    except Exception as e:
+        return ProjectResult(project.root, None, str(e) or type(e).__name__)
+
+
+def generate_many(projects, processes=None, io_limit=4, nfc=False, use_cache=True, validation=None,
+                  excludes=(), includes=(), layout="flat"):
+    """Run generate() for many projects in parallel, one per worker process.
+
+    Each project combines its own .tiledrulesignore with the excludes and
+    includes patterns shared by all projects. At most io_limit projects on
+    the same storage device are scanned and written at a time, so projects
+    sharing a disk or network share don't swamp it. Returns a ProjectResult
+    for each ProjectSpec, in order; errors in one project don't stop the
+    others. layout is passed on to generate().
+    """
+    devices = []
+    for project in projects:
+        try:
+            devices.append(os.stat(project.root).st_dev)
+        except OSError:
+            devices.append(None)
+
+    if processes == 1 or len(projects) <= 1:
+        return [_generate_project(project, nfc, use_cache, device, validation, excludes, includes, layout)
+                for project, device in zip(projects, devices)]
+
+    io_slots = {device: multiprocessing.BoundedSemaphore(io_limit)
+                for device in set(devices) if device is not None}
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_batch_worker,
+                             initargs=(io_slots,)) as pool:
+        futures = [pool.submit(_generate_project, project, nfc, use_cache, device, validation,
+                               excludes, includes, layout)
+                   for project, device in zip(projects, devices)]
+        return [future.result() for future in futures]
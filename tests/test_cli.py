@@ -0,0 +1,104 @@
+"""Tests for the batch mode of rules.py."""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+RULES_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rules.py")
+
+
+def _touch(path):
+    with open(path, "wb"):
+        pass
+
+
+class BatchModeTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="rules_cli_")
+        os.makedirs(os.path.join(self.root, "rules", "a"))
+        os.makedirs(os.path.join(self.root, "empty"))
+        for name in ("a/map9.tmx", "a/map10.tmx", "x.tmx"):
+            _touch(os.path.join(self.root, "rules", name))
+        self.rules_txt = os.path.join(self.root, "rules.txt")
+        with open(self.rules_txt, "wb") as rules_file:
+            rules_file.write(b"rules/x.tmx\r\nold/hand.tmx\r\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def run_cli(self, *args):
+        return subprocess.run([sys.executable, RULES_PY, "--root", self.root, "--yes", "--no-cache", *args],
+                              capture_output=True, text=True, encoding="utf-8")
+
+    def read_rules(self):
+        with open(self.rules_txt, "rb") as rules_file:
+            return rules_file.read()
+
+    def test_streamed_add_keeps_existing_rules(self):
+        result = self.run_cli("--dir", "rules")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(self.read_rules(),
+                         b"rules/x.tmx\nold/hand.tmx\nrules/a/map10.tmx\nrules/a/map9.tmx\n")
+        self.assertIn("2 new rule files", result.stdout)
+        self.assertIn("4 total rules", result.stdout)
+
+    def test_streamed_overwrite_leaves_file_alone_when_nothing_is_found(self):
+        result = self.run_cli("--dir", "empty", "--mode", "overwrite")
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("No .tmx files found", result.stderr)
+        self.assertEqual(self.read_rules(), b"rules/x.tmx\r\nold/hand.tmx\r\n")
+
+    def test_check_reports_order_and_duplicates(self):
+        self.assertEqual(self.run_cli("--dir", "rules", "--mode", "overwrite").returncode, 0)
+        self.assertEqual(self.run_cli("--dir", "rules", "--mode", "overwrite", "--check").returncode, 0)
+        lines = self.read_rules().splitlines(keepends=True)
+        with open(self.rules_txt, "wb") as rules_file:
+            rules_file.writelines(reversed(lines))
+            rules_file.write(lines[0].rstrip(b"\n") + b"\r\n")
+
+        for mode in ("overwrite", "add"):
+            result = self.run_cli("--dir", "rules", "--mode", mode, "--diff")
+            self.assertEqual(result.returncode, 1, mode)
+            self.assertIn("only the order", result.stdout)
+            # Output that doesn't go to a terminal has no colour codes
+            self.assertNotIn("\033[", result.stdout)
+
+    def test_check_reports_tree_order(self):
+        self.assertEqual(self.run_cli("--dir", "rules", "--layout", "tree", "--mode", "overwrite").returncode, 0)
+        self.assertEqual(self.run_cli("--dir", "rules", "--layout", "tree", "--check").returncode, 0)
+        with open(os.path.join(self.root, "rules", ".rulesorder"), "w", encoding="utf-8") as order_file:
+            order_file.write("x.tmx\na\n")
+        result = self.run_cli("--dir", "rules", "--layout", "tree", "--check")
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("rules/rules.txt is out of date", result.stdout)
+
+
+    def test_check_refuses_what_a_run_refuses(self):
+        # The flat rules.txt lists rules/x.tmx, which the tree layout includes from rules/rules.txt
+        result = self.run_cli("--dir", "rules", "--layout", "tree", "--check")
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("--mode overwrite", result.stderr)
+        self.assertEqual(self.run_cli("--dir", "rules", "--layout", "tree").returncode, 1)
+
+        result = self.run_cli("--dir", "empty", "--mode", "overwrite", "--check")
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("No .tmx files found", result.stderr)
+
+    def test_check_output_ends_with_the_report(self):
+        result = self.run_cli("--dir", "rules", "--check")
+        self.assertEqual(result.returncode, 1)
+        self.assertNotIn("Tiled Rules Generator", result.stdout)
+        self.assertTrue(result.stdout.rstrip().endswith("to remove."))
+
+
+    def test_batch_options_need_a_root(self):
+        result = subprocess.run([sys.executable, RULES_PY, "--layout", "tree", "--mode", "overwrite"],
+                                capture_output=True, text=True, encoding="utf-8", stdin=subprocess.DEVNULL)
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("--mode, --layout only work with --root", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Tests for rules_core.IgnoreRules and how scans apply it."""
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rules_core  # noqa: E402
+
+# (exclude patterns, path relative to the main folder, is a folder, excluded)
+EXCLUDE_CASES = [
+    (["*.png"], "a.png", False, True),
+    (["*.png"], "sub/a.png", False, True),
+    (["*.png"], "a.tmx", False, False),
+    # A slash anchors the pattern to the main folder
+    (["/top.tmx"], "top.tmx", False, True),
+    (["/top.tmx"], "sub/top.tmx", False, False),
+    (["rules/old"], "rules/old", True, True),
+    (["rules/old"], "x/rules/old", True, False),
+    (["rules/*.tmx"], "rules/a.tmx", False, True),
+    (["rules/*.tmx"], "rules/sub/a.tmx", False, False),
+    # A trailing slash only matches folders
+    (["build/"], "build", True, True),
+    (["build/"], "a/build", True, True),
+    (["build/"], "build", False, False),
+    (["**/tmp"], "tmp", True, True),
+    (["**/tmp"], "a/b/tmp", True, True),
+    (["a/**/b.tmx"], "a/b.tmx", False, True),
+    (["a/**/b.tmx"], "a/x/y/b.tmx", False, True),
+    (["a/**/b.tmx"], "c/a/x/b.tmx", False, False),
+    (["a/**"], "a/x/y.tmx", False, True),
+    (["map?.tmx"], "map1.tmx", False, True),
+    (["map?.tmx"], "map10.tmx", False, False),
+    (["[ab].tmx"], "b.tmx", False, True),
+    (["[ab].tmx"], "c.tmx", False, False),
+    (["[!a]*.tmx"], "b.tmx", False, True),
+    (["[!a]*.tmx"], "a.tmx", False, False),
+    (["[]]x.tmx"], "]x.tmx", False, True),
+    # Escapes, comments, blank lines and trailing spaces
+    (["\\#x.tmx"], "#x.tmx", False, True),
+    (["#x.tmx", "", "   "], "#x.tmx", False, False),
+    (["\\!x.tmx"], "!x.tmx", False, True),
+    (["a.tmx   "], "a.tmx", False, True),
+    (["a+b (1).tmx"], "a+b (1).tmx", False, True),
+    # "!" re-includes and the last matching pattern wins
+    (["*.tmx", "!keep.tmx"], "keep.tmx", False, False),
+    (["*.tmx", "!keep.tmx"], "other.tmx", False, True),
+    (["!keep.tmx", "*.tmx"], "keep.tmx", False, True),
+    (["old/", "!old/"], "old", True, False),
+]
+
+
+class IgnoreRulesTest(unittest.TestCase):
+    def test_exclude_patterns(self):
+        for patterns, rel, is_dir, excluded in EXCLUDE_CASES:
+            with self.subTest(patterns=patterns, rel=rel, is_dir=is_dir):
+                ignore = rules_core.IgnoreRules(patterns)
+                check = ignore.excludes_dir if is_dir else ignore.excludes_file
+                self.assertEqual(check(rel), excluded)
+
+    def test_include_patterns(self):
+        ignore = rules_core.IgnoreRules(["walls/old/"], ["walls/**", "*_auto.tmx"])
+        self.assertFalse(ignore.excludes_file("walls/a.tmx"))
+        self.assertFalse(ignore.excludes_file("floors/x_auto.tmx"))
+        self.assertTrue(ignore.excludes_file("floors/a.tmx"))
+        # Includes only pick files; folders are still walked unless excluded
+        self.assertFalse(ignore.excludes_dir("floors"))
+        self.assertTrue(ignore.excludes_dir("walls/old"))
+
+    def test_empty(self):
+        self.assertFalse(rules_core.IgnoreRules(["", "# comment", "/"]))
+        self.assertTrue(rules_core.IgnoreRules(includes=["*.tmx"]))
+
+
+class IgnoreScanTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="rules_ignore_")
+        self.rules = os.path.join(self.root, "rules")
+        for rel in ("keep/a.tmx", "keep/b.png", "skip/c.tmx", "skip/deep/d.tmx", "e.tmx"):
+            path = os.path.join(self.rules, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb"):
+                pass
+        with open(os.path.join(self.root, rules_core.IgnoreRules.FILENAME), "w", encoding="utf-8") as ignore_file:
+            ignore_file.write("# Old rules\nskip/\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_pruned_folders_are_never_listed(self):
+        ignore = rules_core.IgnoreRules.load(self.root, ["e.tmx"])
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                events = io.StringIO()
+                profiler = rules_core.Profiler(events=events)
+                found = sorted(rules_core.scan(self.root, [self.rules], workers, ignore=ignore, profiler=profiler))
+                self.assertEqual(found, ["rules/keep/a.tmx"])
+                listed = sorted(os.path.relpath(event["path"], self.root).replace("\\", "/")
+                                for event in map(json.loads, events.getvalue().splitlines())
+                                if event["event"] == "dir")
+                self.assertEqual(listed, ["rules", "rules/keep"])
+                self.assertEqual(profiler.counters["dirs"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Tests for rules_core.load_manifest() and generate_many()."""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rules_core  # noqa: E402
+
+
+class LoadManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.base = tempfile.mkdtemp(prefix="rules_manifest_")
+        self.path = os.path.join(self.base, "projects.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.base, ignore_errors=True)
+
+    def load(self, data):
+        with open(self.path, "w", encoding="utf-8") as manifest_file:
+            json.dump(data, manifest_file)
+        return rules_core.load_manifest(self.path)
+
+    def test_single_folder_name(self):
+        projects = self.load({"dirs": "rules", "projects": ["a", {"root": "b", "dirs": "extra"}]})
+        self.assertEqual([project.dirs for project in projects], [["rules"], ["extra"]])
+
+    def test_invalid_dirs_names_the_project(self):
+        with self.assertRaisesRegex(ValueError, r"project 2 \(b\)"):
+            self.load({"dirs": ["rules"], "projects": ["a", {"root": "b", "dirs": ["rules", 3]}]})
+        with self.assertRaisesRegex(ValueError, "the manifest"):
+            self.load({"dirs": {"rules": True}, "projects": ["a"]})
+
+    def test_invalid_root_names_the_project(self):
+        with self.assertRaisesRegex(ValueError, "project 2 has invalid 'root' 5"):
+            self.load({"dirs": "rules", "projects": ["a", {"root": 5}]})
+
+
+class GenerateManyTest(unittest.TestCase):
+    def setUp(self):
+        self.base = tempfile.mkdtemp(prefix="rules_many_")
+        for name in ("a", "b"):
+            os.makedirs(os.path.join(self.base, name, "rules"))
+            with open(os.path.join(self.base, name, "rules.txt"), "w", encoding="utf-8") as rules_file:
+                rules_file.write("hand/written.tmx\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.base, ignore_errors=True)
+
+    def read_rules(self, name):
+        with open(os.path.join(self.base, name, "rules.txt"), "r", encoding="utf-8") as rules_file:
+            return rules_file.read()
+
+    def test_empty_scan_never_overwrites(self):
+        with open(os.path.join(self.base, "b", "rules", "map.tmx"), "wb"):
+            pass
+        projects = [rules_core.ProjectSpec(os.path.join(self.base, name), ["rules"], "overwrite")
+                    for name in ("a", "b")]
+        results = rules_core.generate_many(projects, processes=1, use_cache=False)
+        self.assertIn("no rule maps found", results[0].error)
+        self.assertEqual(self.read_rules("a"), "hand/written.tmx\n")
+        self.assertIsNone(results[1].error)
+        self.assertEqual(self.read_rules("b"), "rules/map.tmx\n")
+
+    def test_empty_scan_adds_nothing(self):
+        project = rules_core.ProjectSpec(os.path.join(self.base, "a"), ["rules"], "add")
+        results = rules_core.generate_many([project], processes=1, use_cache=False)
+        self.assertIsNone(results[0].error)
+        self.assertEqual(self.read_rules("a"), "hand/written.tmx\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+"""Tests for rules_core.iter_tmx_dirs() and the scan cache."""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rules_core  # noqa: E402
+
+# Old enough for the scan cache to trust the folder timestamps
+OLD = time.time() - 3600
+
+
+def _touch(path):
+    with open(path, "wb"):
+        pass
+
+
+class ScanTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="rules_scan_")
+        self.rules = os.path.join(self.root, "rules")
+        self.more = os.path.join(self.root, "more")
+        for top in (self.rules, self.more):
+            for a in range(4):
+                for b in range(3):
+                    folder = os.path.join(top, f"d{a}", f"e{b}")
+                    os.makedirs(folder)
+                    _touch(os.path.join(folder, f"map{b}.tmx"))
+                _touch(os.path.join(top, f"d{a}", "A.TMX"))
+        _touch(os.path.join(self.rules, "top.tmx"))
+        _touch(os.path.join(self.rules, "tiles.png"))
+        self.age_folders()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def age_folders(self, root=None):
+        for path, _, _ in os.walk(root or self.root):
+            os.utime(path, (OLD, OLD))
+
+    def scan_dirs(self, workers, cache=None, directories=None):
+        return [(scanned.index, scanned.rel, scanned.tmx_names)
+                for scanned in rules_core.iter_tmx_dirs(self.root, directories or [self.rules, self.more],
+                                                        workers, cache)]
+
+    def expected_dirs(self, directories):
+        expected = []
+        for index, directory in enumerate(directories):
+            for path, subdirs, files in os.walk(directory):
+                subdirs.sort()
+                rel = os.path.relpath(path, self.root).replace("\\", "/")
+                expected.append((index, rel, sorted(name for name in files if name.lower().endswith(".tmx"))))
+        return expected
+
+    def test_same_order_for_any_number_of_workers(self):
+        directories = [self.rules, self.more, os.path.join(self.rules, "d1")]
+        expected = self.expected_dirs(directories)
+        # Small batches, so threads hand back unfinished subtrees
+        with mock.patch.object(rules_core, "SCAN_BATCH_DIRS", 3):
+            for workers in (1, 2, 4, 8):
+                with self.subTest(workers=workers):
+                    self.assertEqual(self.scan_dirs(workers, directories=directories), expected)
+                    cache = rules_core.ScanCache.load(self.root)
+                    self.assertEqual(self.scan_dirs(workers, cache, directories), expected)
+                    cache.save()
+                    cache = rules_core.ScanCache.load(self.root)
+                    self.assertEqual(self.scan_dirs(workers, cache, directories), expected)
+                    self.assertEqual(cache.misses, 0)
+
+    def test_warm_scan_lists_nothing(self):
+        cache = rules_core.ScanCache.load(self.root)
+        cold = self.scan_dirs(1, cache)
+        self.assertEqual((cache.hits, cache.misses), (0, len(cold)))
+        cache.save()
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                cache = rules_core.ScanCache.load(self.root)
+                profiler = rules_core.Profiler()
+                scanned = list(rules_core.iter_tmx_dirs(self.root, [self.rules, self.more], workers, cache,
+                                                        profiler=profiler))
+                self.assertEqual(len(scanned), len(cold))
+                self.assertEqual((cache.hits, cache.misses), (len(cold), 0))
+                self.assertEqual(profiler.counters["cached_dirs"], len(cold))
+                self.assertEqual(profiler.counters["entries"], 0)
+
+    def test_changed_folder_is_listed_again(self):
+        cache = rules_core.ScanCache.load(self.root)
+        self.scan_dirs(1, cache)
+        cache.save()
+        folder = os.path.join(self.rules, "d2", "e1")
+        _touch(os.path.join(folder, "new.tmx"))
+
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                cache = rules_core.ScanCache.load(self.root)
+                scanned = dict((rel, names) for _, rel, names in self.scan_dirs(workers, cache))
+                self.assertEqual(scanned["rules/d2/e1"], ["map1.tmx", "new.tmx"])
+                self.assertEqual(cache.misses, 1)
+                # Just modified, so the folder could still change within its timestamp tick
+                cache.save()
+
+        cache = rules_core.ScanCache.load(self.root)
+        self.scan_dirs(1, cache)
+        self.assertEqual(cache.misses, 1)
+        self.assertNotIn("rules/d2/e1", cache._new)
+
+        # Once it has settled it is cached again
+        os.utime(folder, (OLD + 1, OLD + 1))
+        cache.save()
+        cache = rules_core.ScanCache.load(self.root)
+        self.scan_dirs(1, cache)
+        cache.save()
+        cache = rules_core.ScanCache.load(self.root)
+        self.scan_dirs(1, cache)
+        self.assertEqual(cache.misses, 0)
+
+    def warm_cache(self):
+        cache = rules_core.ScanCache.load(self.root)
+        self.scan_dirs(1, cache)
+        cache.save()
+        cache = rules_core.ScanCache.load(self.root)
+        self.scan_dirs(1, cache)
+        self.assertEqual(cache.misses, 0)
+        return cache.path
+
+    def reloaded_hits(self):
+        cache = rules_core.ScanCache.load(self.root)
+        self.scan_dirs(1, cache)
+        return cache.hits
+
+    def test_dropped_on_version_change(self):
+        path = self.warm_cache()
+        with open(path, "r", encoding="utf-8") as cache_file:
+            data = json.load(cache_file)
+        data["version"] = rules_core.ScanCache.VERSION + 1
+        with open(path, "w", encoding="utf-8") as cache_file:
+            json.dump(data, cache_file)
+        self.assertEqual(self.reloaded_hits(), 0)
+
+    def test_dropped_on_root_path_change(self):
+        self.warm_cache()
+        moved = self.root + "_moved"
+        os.rename(self.root, moved)
+        self.addCleanup(shutil.rmtree, moved, ignore_errors=True)
+        self.root = moved
+        self.rules = os.path.join(moved, "rules")
+        self.more = os.path.join(moved, "more")
+        self.assertEqual(self.reloaded_hits(), 0)
+
+    def test_dropped_on_root_inode_change(self):
+        self.warm_cache()
+        # Move everything into a new main folder at the same path; the rule
+        # folders keep their inodes and timestamps, the main folder doesn't
+        old = self.root + "_old"
+        os.rename(self.root, old)
+        self.addCleanup(shutil.rmtree, old, ignore_errors=True)
+        os.mkdir(self.root)
+        for name in os.listdir(old):
+            os.rename(os.path.join(old, name), os.path.join(self.root, name))
+        self.age_folders()
+        self.assertEqual(self.reloaded_hits(), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""Tests for the tree layout of rules_core.generate()."""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rules_core  # noqa: E402
+
+
+def _touch(path):
+    with open(path, "wb"):
+        pass
+
+
+def _lines(path):
+    with open(path, "r", encoding="utf-8") as rules_file:
+        return rules_file.read().splitlines()
+
+
+class TreeLayoutTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="rules_tree_")
+        self.rules = os.path.join(self.root, "rules")
+        os.makedirs(os.path.join(self.rules, "a"))
+        for name in ("a/map9.tmx", "a/map10.tmx", "x.tmx"):
+            _touch(os.path.join(self.rules, name))
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def generate(self, mode="add"):
+        return rules_core.generate(self.root, [self.rules], mode=mode, layout="tree")
+
+    def test_folder_files_follow_their_folder(self):
+        self.generate()
+        self.assertEqual(_lines(os.path.join(self.rules, "rules.txt")), ["a/rules.txt", "x.tmx"])
+        self.assertEqual(_lines(os.path.join(self.rules, "a", "rules.txt")), ["map9.tmx", "map10.tmx"])
+
+        # Order overrides, new and deleted maps take effect in add mode too
+        with open(os.path.join(self.rules, "a", rules_core.ORDER_FILENAME), "w", encoding="utf-8") as order_file:
+            order_file.write("map10.tmx\n")
+        _touch(os.path.join(self.rules, "a", "map1.tmx"))
+        os.remove(os.path.join(self.rules, "a", "map9.tmx"))
+        with open(os.path.join(self.root, "rules.txt"), "a", encoding="utf-8") as rules_file:
+            rules_file.write("other/rules.txt\n")
+        self.generate()
+        self.assertEqual(_lines(os.path.join(self.rules, "a", "rules.txt")), ["map10.tmx", "map1.tmx"])
+        # The main rules.txt keeps its own entries in add mode
+        self.assertEqual(_lines(os.path.join(self.root, "rules.txt")), ["rules/rules.txt", "other/rules.txt"])
+
+    def test_adding_to_a_flat_rules_txt_is_refused(self):
+        rules_core.generate(self.root, [self.rules])
+        with self.assertRaises(ValueError):
+            self.generate()
+        self.assertTrue(self.generate("overwrite").written)
+        self.assertEqual(_lines(os.path.join(self.root, "rules.txt")), ["rules/rules.txt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
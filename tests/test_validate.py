@@ -0,0 +1,136 @@
+"""Tests for rules_core.validate_rule_map() and the validation cache."""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rules_core  # noqa: E402
+
+# Old enough for the validation cache to trust the file timestamps
+OLD = time.time() - 3600
+
+MAP = '<?xml version="1.0" encoding="UTF-8"?>\n<map version="1.10" orientation="orthogonal">{}</map>\n'
+TILESET = '<tileset name="tiles"><image source="tiles.png"/></tileset>'
+
+
+def _layer(name, tag="layer"):
+    return f'<{tag} id="1" name="{name}"><data encoding="csv">0</data></{tag}>'
+
+
+class ValidateRuleMapTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="rules_validate_")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def check(self, content, name="map.tmx"):
+        path = os.path.join(self.root, name)
+        with open(path, "w", encoding="utf-8") as map_file:
+            map_file.write(content)
+        return rules_core.validate_rule_map(path)
+
+    def assertReason(self, content, reason):
+        result = self.check(content)
+        self.assertFalse(result.valid)
+        self.assertEqual(result.reason, reason)
+
+    def test_rule_map(self):
+        result = self.check(MAP.format(TILESET + _layer("input_floor") + _layer("regions") + _layer("output_floor")))
+        self.assertEqual(result, rules_core.ValidationResult(os.path.join(self.root, "map.tmx"), True, None))
+
+    def test_names_are_case_insensitive(self):
+        self.assertTrue(self.check(MAP.format(_layer("Input") + _layer("OUTPUT_walls"))).valid)
+
+    def test_layers_in_groups(self):
+        group = f'<group id="3" name="rules">{_layer("input_a")}<group name="inner">{_layer("output_a")}</group></group>'
+        self.assertTrue(self.check(MAP.format(group)).valid)
+
+    def test_object_layer_output(self):
+        output = '<objectgroup id="2" name="output_objects"><object id="1" x="0" y="0"/></objectgroup>'
+        self.assertTrue(self.check(MAP.format(_layer("input") + output)).valid)
+
+    def test_object_layer_input_is_rejected(self):
+        content = MAP.format(_layer("input_objects", "objectgroup") + _layer("output"))
+        self.assertReason(content, "no input layer")
+
+    def test_missing_layers(self):
+        self.assertReason(MAP.format(_layer("input")), "no output layer")
+        self.assertReason(MAP.format(_layer("Tile Layer 1")), "no input or output layers")
+        self.assertReason(MAP.format(""), "no input or output layers")
+
+    def test_stops_reading_once_both_layers_are_found(self):
+        # Everything after the output layer is broken, so a full parse would fail
+        content = MAP.format(_layer("input") + _layer("output")).replace("</map>", "<layer <<< not xml")
+        self.assertTrue(self.check(content).valid)
+
+    def test_not_a_map(self):
+        self.assertReason('<?xml version="1.0"?>\n' + TILESET, "not a Tiled map")
+
+    def test_broken_xml(self):
+        for content in ("", "not xml at all", MAP.format(_layer("input")).replace("</map>", "")):
+            with self.subTest(content=content):
+                result = self.check(content)
+                self.assertFalse(result.valid)
+                self.assertTrue(result.reason.startswith("not valid XML"), result.reason)
+
+    def test_unreadable(self):
+        result = rules_core.validate_rule_map(os.path.join(self.root, "missing.tmx"))
+        self.assertFalse(result.valid)
+        self.assertTrue(result.reason.startswith("can't be read"), result.reason)
+
+
+class ValidationCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="rules_validate_cache_")
+        self.write("good.tmx", MAP.format(_layer("input") + _layer("output")))
+        self.write("bad.tmx", MAP.format(_layer("input")))
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write(self, name, content, mtime=OLD):
+        path = os.path.join(self.root, name)
+        with open(path, "w", encoding="utf-8") as map_file:
+            map_file.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def validate(self, tmx_files=("good.tmx", "bad.tmx")):
+        cache = rules_core.ValidationCache.load(self.root)
+        with mock.patch.object(rules_core, "validate_rule_map", wraps=rules_core.validate_rule_map) as parse:
+            results = rules_core.validate(self.root, list(tmx_files), processes=1, cache=cache)
+        cache.save()
+        parsed = sorted(os.path.basename(call.args[0]) for call in parse.call_args_list)
+        return [(result.path, result.valid, result.reason) for result in results], parsed
+
+    def test_unchanged_files_are_not_parsed_again(self):
+        expected = [("good.tmx", True, None), ("bad.tmx", False, "no output layer")]
+        self.assertEqual(self.validate(), (expected, ["bad.tmx", "good.tmx"]))
+        self.assertEqual(self.validate(), (expected, []))
+
+    def test_changed_files_are_parsed_again(self):
+        self.validate()
+        # A different size, and the same size with a different mtime
+        self.write("bad.tmx", MAP.format(_layer("input") + _layer("output")))
+        self.write("good.tmx", MAP.format(_layer("input") + _layer("outpux")), OLD + 1)
+        results, parsed = self.validate()
+        self.assertEqual(parsed, ["bad.tmx", "good.tmx"])
+        self.assertEqual(results, [("good.tmx", False, "no output layer"), ("bad.tmx", True, None)])
+
+    def test_recent_files_are_not_cached(self):
+        self.write("new.tmx", MAP.format(_layer("input") + _layer("output")), time.time())
+        self.validate(["good.tmx", "new.tmx"])
+        self.assertEqual(self.validate(["good.tmx", "new.tmx"])[1], ["new.tmx"])
+
+    def test_only_files_seen_last_are_kept(self):
+        self.validate()
+        self.validate(["good.tmx"])
+        self.assertEqual(self.validate()[1], ["bad.tmx"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+"""Tests for rules_core.watch() and the watch mode of rules.py on a temporary project folder."""
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rules  # noqa: E402
+import rules_core  # noqa: E402
+
+
+def _touch(path):
+    with open(path, "wb"):
+        pass
+
+
+class WatchTest(unittest.TestCase):
+    # Short enough to keep the tests quick, long enough for slow machines
+    INTERVAL = 0.05
+    QUIET = 0.5
+    TIMEOUT = 10
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="rules_watch_")
+        self.rules = os.path.join(self.root, "rules")
+        os.mkdir(self.rules)
+        _touch(os.path.join(self.rules, "a.tmx"))
+        self.changes = queue.Queue()
+        self.errors = []
+        self.stop = threading.Event()
+        self.thread = None
+
+    def tearDown(self):
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join(self.TIMEOUT)
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.assertEqual(self.errors, [])
+
+    def start(self, use_inotify):
+        def run():
+            try:
+                rules_core.watch(self.root, [self.rules], lambda tmx_files: self.changes.put(sorted(tmx_files)),
+                                 interval=self.INTERVAL, debounce=self.INTERVAL, stop=self.stop,
+                                 use_inotify=use_inotify)
+            except Exception as e:
+                self.errors.append(e)
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def next_change(self):
+        return self.changes.get(timeout=self.TIMEOUT)
+
+    def check_changes(self):
+        self.assertEqual(self.next_change(), ["rules/a.tmx"])
+
+        _touch(os.path.join(self.rules, "b.tmx"))
+        self.assertEqual(self.next_change(), ["rules/a.tmx", "rules/b.tmx"])
+
+        os.rename(os.path.join(self.rules, "b.tmx"), os.path.join(self.rules, "c.tmx"))
+        self.assertEqual(self.next_change(), ["rules/a.tmx", "rules/c.tmx"])
+
+        # Files that aren't rule maps and new empty folders don't change rules.txt
+        _touch(os.path.join(self.rules, "tiles.png"))
+        os.mkdir(os.path.join(self.rules, "sub"))
+        _touch(os.path.join(self.rules, "sub", "notes.txt"))
+        with self.assertRaises(queue.Empty):
+            self.changes.get(timeout=self.QUIET)
+
+        # ...but rule maps added to the new folder do
+        _touch(os.path.join(self.rules, "sub", "d.tmx"))
+        self.assertEqual(self.next_change(), ["rules/a.tmx", "rules/c.tmx", "rules/sub/d.tmx"])
+
+        os.remove(os.path.join(self.rules, "a.tmx"))
+        self.assertEqual(self.next_change(), ["rules/c.tmx", "rules/sub/d.tmx"])
+
+    def test_polling(self):
+        self.start(use_inotify=False)
+        self.check_changes()
+
+    def test_inotify(self):
+        notifier = rules_core._Inotify.create()
+        if notifier is None:
+            self.skipTest("inotify is not available")
+        notifier.close()
+        self.start(use_inotify=True)
+        self.check_changes()
+
+
+class KeptRulesTest(unittest.TestCase):
+    def test_drops_only_maps_the_scan_no_longer_finds(self):
+        existing = ["rules/z.tmx", "other/x.tmx", "rules/gone.tmx", "extra/rules.txt", "Rules\\A.TMX",
+                    "rules/notes.txt"]
+        kept = rules_core.kept_rules(existing, ["rules/a.tmx", "rules/z.tmx"], "/p", ["/p/rules"])
+        self.assertEqual(list(kept), ["rules/z.tmx", "other/x.tmx", "extra/rules.txt", "Rules\\A.TMX",
+                                      "rules/notes.txt"])
+
+    def test_main_folder_selected(self):
+        kept = rules_core.kept_rules(["a.tmx", "sub/rules.txt"], [], "/p", ["/p"])
+        self.assertEqual(list(kept), ["sub/rules.txt"])
+
+
+class RunWatchTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="rules_run_watch_")
+        os.mkdir(os.path.join(self.root, "rules"))
+        self.rules_txt = os.path.join(self.root, "rules.txt")
+        with open(self.rules_txt, "w", encoding="utf-8") as rules_file:
+            rules_file.write("rules/z.tmx\nother/x.tmx\nrules/b.tmx\nrules/a.tmx\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_add_mode_keeps_hand_set_order(self):
+        scans = [["rules/a.tmx", "rules/b.tmx", "rules/c.tmx", "rules/z.tmx"],
+                 ["rules/a.tmx", "rules/c.tmx", "rules/d.tmx", "rules/z.tmx"]]
+        results = []
+
+        def fake_watch(root_dir, directories, on_change, **kwargs):
+            for tmx_files in scans:
+                on_change(tmx_files)
+                with open(self.rules_txt, "r", encoding="utf-8") as rules_file:
+                    results.append(rules_file.read().splitlines())
+
+        args = rules.parse_args(["--root", self.root, "--dir", "rules", "--watch", "--quiet", "--no-cache"])
+        with mock.patch.object(rules_core, "watch", fake_watch):
+            self.assertEqual(rules.run_watch(args, self.root, [os.path.join(self.root, "rules")], None), 0)
+        self.assertEqual(results, [
+            ["rules/z.tmx", "other/x.tmx", "rules/b.tmx", "rules/a.tmx", "rules/c.tmx"],
+            ["rules/z.tmx", "other/x.tmx", "rules/a.tmx", "rules/c.tmx", "rules/d.tmx"],
+        ])
+
+if __name__ == "__main__":
+    unittest.main()